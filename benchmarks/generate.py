@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Generate synthetic Twitter archive files for benchmarking lptwitdelete.
+
+Usage:
+
+    python benchmarks/generate.py --tweets 100000 --dms 10000 -o bench_data
+
+writes bench_data/tweet.js and bench_data/direct-messages.js, in the format of
+a downloaded Twitter archive. Records are written as they are generated, so
+archives of millions of records can be generated in constant memory.
+"""
+
+import json
+import random
+
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import IO, Iterator, List, Optional
+
+# Proportions of generated tweets that are retweets and replies
+RETWEET_FRACTION = 0.3
+REPLY_FRACTION = 0.2
+
+# Proportion of DMs that are welcome messages
+WELCOME_FRACTION = 0.05
+
+# Number of messages in each generated DM conversation
+MESSAGES_PER_CONVERSATION = 50
+
+# Generated records span this period, starting at EPOCH
+EPOCH = datetime(2010, 1, 1, tzinfo=timezone.utc)
+SPAN = timedelta(days=365 * 12)
+
+WORDS = "the a tweet python data archive delete science lunch coffee train rain bioinformatics code".split()
+USERS = ["user%d" % _ for _ in range(200)]
+DOMAINS = ["example.com", "github.com", "doi.org", "bbc.co.uk", "strath.ac.uk"]
+
+
+def make_tweet(rng: random.Random, idx: int, count: int) -> dict:
+    """Return a synthetic tweet archive record.
+
+    :param rng:  random number generator
+    :param idx:  index of the tweet; later indices are newer tweets
+    :param count:  total number of tweets being generated
+    """
+    created = EPOCH + SPAN * idx / max(count, 1)
+    tweet_id = str(100000000000000000 + idx * 1000 + rng.randrange(1000))
+    mentions = rng.sample(USERS, rng.randrange(3))
+    hashtags = rng.sample(WORDS, rng.randrange(3))
+    urls = [f"https://{rng.choice(DOMAINS)}/{rng.randrange(10**6)}" for _ in range(rng.randrange(2))]
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randrange(5, 25)))
+    text = " ".join([text] + ["#" + _ for _ in hashtags] + ["@" + _ for _ in mentions] + urls)
+
+    tweet = {
+        "retweeted": False,
+        "source": '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App</a>',
+        "entities": {
+            "hashtags": [{"text": _, "indices": ["0", "0"]} for _ in hashtags],
+            "symbols": [],
+            "user_mentions": [
+                {"name": _, "screen_name": _, "indices": ["0", "0"], "id_str": str(USERS.index(_))}
+                for _ in mentions
+            ],
+            "urls": [{"url": "https://t.co/x", "expanded_url": _, "display_url": _, "indices": ["0", "0"]} for _ in urls],
+        },
+        "display_text_range": ["0", str(len(text))],
+        "favorite_count": str(rng.randrange(20)),
+        "id_str": tweet_id,
+        "truncated": False,
+        "retweet_count": str(rng.randrange(10)),
+        "id": tweet_id,
+        "created_at": created.strftime("%a %b %d %H:%M:%S %z %Y"),
+        "favorited": False,
+        "full_text": text,
+        "lang": "en",
+    }
+    roll = rng.random()
+    if roll < RETWEET_FRACTION:
+        tweet["full_text"] = f"RT @{rng.choice(USERS)}: {text}"
+    elif roll < RETWEET_FRACTION + REPLY_FRACTION:
+        user = rng.choice(USERS)
+        tweet["in_reply_to_status_id_str"] = str(int(tweet_id) - 1)
+        tweet["in_reply_to_user_id_str"] = str(USERS.index(user))
+        tweet["in_reply_to_screen_name"] = user
+        tweet["full_text"] = f"@{user} {text}"
+    return {"tweet": tweet}
+
+
+def make_conversation(rng: random.Random, idx: int, nmessages: int, first: int, count: int) -> dict:
+    """Return a synthetic DM conversation archive record.
+
+    :param rng:  random number generator
+    :param idx:  index of the conversation
+    :param nmessages:  number of messages in the conversation
+    :param first:  index of the first message in the conversation
+    :param count:  total number of messages being generated
+    """
+    messages = []
+    for msg in range(first, first + nmessages):
+        created = EPOCH + SPAN * msg / max(count, 1)
+        message = {
+            "recipientId": str(idx),
+            "reactions": [],
+            "urls": [],
+            "text": " ".join(rng.choice(WORDS) for _ in range(rng.randrange(3, 30))),
+            "mediaUrls": [],
+            "senderId": str(rng.choice([0, idx])),
+            "id": str(200000000000000000 + msg),
+            "createdAt": created.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        }
+        key = "welcomeMessageCreate" if rng.random() < WELCOME_FRACTION else "messageCreate"
+        messages.append({key: message})
+    return {"dmConversation": {"conversationId": f"0-{idx}", "messages": messages}}
+
+
+def write_array(ofh: IO[str], prefix: str, records: Iterator[dict]) -> None:
+    """Write records to the passed filehandle as an archive-style JavaScript array.
+
+    :param ofh:  open filehandle
+    :param prefix:  JavaScript assignment preceding the array
+    :param records:  iterable of records
+    """
+    ofh.write(f"{prefix} = [")
+    for idx, record in enumerate(records):
+        if idx:
+            ofh.write(",")
+        ofh.write("\n")
+        ofh.write(json.dumps(record, indent=2))
+    ofh.write("\n]")
+
+
+def generate(outdir: Path, ntweets: int, ndms: int, seed: int = 0) -> None:
+    """Write synthetic tweet.js and direct-messages.js files to the passed directory.
+
+    :param outdir:  output directory
+    :param ntweets:  number of tweets to generate
+    :param ndms:  number of direct messages to generate
+    :param seed:  random seed, so that generated archives are reproducible
+    """
+    rng = random.Random(seed)
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    with (outdir / "tweet.js").open("w", encoding="utf-8") as ofh:
+        # Archives list tweets newest first
+        write_array(
+            ofh,
+            "window.YTD.tweets.part0",
+            (make_tweet(rng, idx, ntweets) for idx in reversed(range(ntweets))),
+        )
+
+    def conversations():
+        for idx, first in enumerate(range(0, ndms, MESSAGES_PER_CONVERSATION)):
+            yield make_conversation(rng, idx, min(MESSAGES_PER_CONVERSATION, ndms - first), first, ndms)
+
+    with (outdir / "direct-messages.js").open("w", encoding="utf-8") as ofh:
+        write_array(ofh, "window.YTD.direct_messages.part0", conversations())
+
+
+def parse_cmdline(argv: Optional[List[str]] = None) -> Namespace:
+    """Parse command-line arguments for the archive generator.
+
+    :param argv:  list of command-line arguments
+    """
+    parser = ArgumentParser(description="Generate synthetic Twitter archive files")
+    parser.add_argument("-o", "--outdir", type=Path, default=Path("bench_data"), help="output directory")
+    parser.add_argument("--tweets", type=int, default=10000, help="number of tweets to generate")
+    parser.add_argument("--dms", type=int, default=1000, help="number of DMs to generate")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_cmdline()
+    generate(args.outdir, args.tweets, args.dms, args.seed)
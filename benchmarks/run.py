@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Time and memory-profile lptwitdelete on synthetic Twitter archives.
+
+Usage (with lptwitdelete installed, e.g. by pip install -e .):
+
+    python benchmarks/run.py --tweets 100000 --dms 10000 -o results.json
+    python benchmarks/run.py --tweets 100000 --dms 10000 --compare results.json
+
+Synthetic archives are generated in --data if they are not already present.
+Each benchmark reports the best wall-clock time of --repeat runs, and the
+peak memory allocated by Python during a separate run under tracemalloc.
+Results are written as JSON, with the current git commit, so that runs can
+be compared across commits with --compare.
+
+The runner exits with an error if tweepy, yaml or requests are imported
+at startup of the lptwitdelete script, as this slows archive-only runs.
+"""
+
+import io
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from generate import generate
+
+from lptwitdelete.archive import iter_archive, load_filter_archive
+from lptwitdelete.expression import compile_predicate, parse_expression
+from lptwitdelete.filters import date_in_range, is_reply, is_retweet, parse_date
+from lptwitdelete.output import write_records
+from lptwitdelete.parser import parse_cmdline as parse_lptd_cmdline
+from lptwitdelete.progress import Progress
+from lptwitdelete.records import compact
+
+# Filter expression used to benchmark compiled predicates
+EXPRESSION = "retweet and created < 2016-01-01 and favorite_count < 5"
+
+# Slow-to-import modules that must not be imported at startup of the lptwitdelete
+# script, so that archive-only runs start quickly
+LAZY_MODULES = ("tweepy", "yaml", "requests")
+
+
+def cli_args(*argv: str) -> Namespace:
+    """Return lptwitdelete command-line namespace for the passed arguments."""
+    return parse_lptd_cmdline(["benchmark", "--skip_auth"] + list(argv))
+
+
+def measure(func: Callable[[], object], repeat: int, memory: bool) -> Dict[str, float]:
+    """Return best time, and peak traced memory, of calling the passed function.
+
+    :param func:  function to benchmark
+    :param repeat:  number of timed calls
+    :param memory:  if True, make an additional call under tracemalloc
+    """
+    times = []
+    for _ in range(repeat):
+        time0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - time0)
+    result = {"seconds": min(times)}
+    if memory:
+        tracemalloc.start()
+        func()
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def benchmarks(datadir: Path, outdir: Path, delete_count: int, latency: float) -> Dict[str, Callable]:
+    """Return dictionary of benchmark name to function.
+
+    :param datadir:  directory containing tweet.js and direct-messages.js
+    :param outdir:  directory for benchmark output files
+    :param delete_count:  number of tweets deleted in deletion benchmarks
+    :param latency:  per-request latency of the fake API (seconds)
+    """
+    tweetpath, dmpath = datadir / "tweet.js", datadir / "direct-messages.js"
+    tweets = list(iter_archive(tweetpath))
+    start, end = parse_date("2012-01-01"), parse_date("2018-01-01")
+    predicate = compile_predicate(parse_expression(EXPRESSION))
+
+    def consume(func: Callable, records: List) -> Callable:
+        return lambda: sum(1 for _ in filter(func, records))
+
+    funcs = {
+        "startup.import": lambda: subprocess.run([sys.executable, "-c", "import lptwitdelete.lptwitdelete"], check=True),
+        "load_filter_archive.tweets": lambda: load_filter_archive(cli_args("-a", tweetpath)),
+        "load_filter_archive.dms": lambda: load_filter_archive(cli_args("-a", dmpath)),
+        "load_filter_archive.dates": lambda: load_filter_archive(
+            cli_args("-a", tweetpath, "--start_date", "2012-01-01", "--end_date", "2018-01-01")
+        ),
+        "load_filter_archive.parallel": lambda: load_filter_archive(
+            cli_args("-a", tweetpath, "--start_date", "2012-01-01", "--end_date", "2018-01-01", "--parallel")
+        ),
+        "load_filter_archive.hashtag": lambda: load_filter_archive(cli_args("-a", tweetpath, "--hashtag", "python")),
+        "load_filter_archive.hashtag_cached": lambda: load_filter_archive(
+            cli_args("-a", tweetpath, "--hashtag", "python", "--cache_dir", outdir / "cache")
+        ),
+        "predicate.date_in_range": consume(lambda _: date_in_range(_, start, end), tweets),
+        "predicate.is_retweet": consume(is_retweet, tweets),
+        "predicate.is_reply": consume(is_reply, tweets),
+        "predicate.expression": consume(predicate, tweets),
+        "records.compact": lambda: [compact(_) for _ in tweets],
+        "progress.update": lambda: sum(1 for _ in Progress(len(tweets), stream=io.StringIO()).iterate(tweets)),
+    }
+    for suffix in (".json", ".jsonl", ".json.gz"):
+        outfile = outdir / f"outfile{suffix}"
+        funcs[f"outfile{suffix}"] = lambda outfile=outfile: sum(1 for _ in write_records(tweets, outfile))
+
+    try:
+        from lptwitdelete.fakeapi import FakeTwitter
+        from lptwitdelete.twitter import delete_tweets, filter_twitter, pooled_session
+    except ImportError:  # tweepy or requests not installed
+        return funcs
+    for concurrency in (1, 8):
+        funcs[f"delete_tweets.concurrency{concurrency}"] = lambda concurrency=concurrency: delete_tweets(
+            FakeTwitter(latency=latency, tweets=0).login(pooled_session(concurrency)),
+            tweets[:delete_count],
+            concurrency=concurrency,
+        )
+
+    # Fetch, filter and delete retweets from the fake API's timeline, retrying
+    # deletions that fail with server errors
+    def pipeline() -> None:
+        api = FakeTwitter(latency=latency, error_rate=0.01, tweets=delete_count).login(pooled_session(8))
+        delete_tweets(api, filter_twitter(api, cli_args("--is_retweet")), concurrency=8)
+
+    funcs["pipeline.fake_api"] = pipeline
+    return funcs
+
+
+def eager_imports() -> List[str]:
+    """Return those LAZY_MODULES that are imported at startup of the lptwitdelete script."""
+    code = f"import sys, lptwitdelete.lptwitdelete; print(*[_ for _ in {LAZY_MODULES!r} if _ in sys.modules])"
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, check=True, text=True).stdout.split()
+
+
+def git_commit() -> Optional[str]:
+    """Return the current git commit of the working directory, if available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline: Dict) -> None:
+    """Print a comparison of the passed results to a baseline.
+
+    :param results:  results of this run
+    :param baseline:  results of an earlier run
+    """
+    print(f"{'benchmark':40} {'baseline (s)':>14} {'this run (s)':>14} {'ratio':>8}")
+    for name, result in results["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:40} {'-':>14} {result['seconds']:14.4f} {'-':>8}")
+        else:
+            ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("nan")
+            print(f"{name:40} {before['seconds']:14.4f} {result['seconds']:14.4f} {ratio:8.2f}")
+
+
+def parse_cmdline(argv: Optional[List[str]] = None) -> Namespace:
+    """Parse command-line arguments for the benchmark runner.
+
+    :param argv:  list of command-line arguments
+    """
+    parser = ArgumentParser(description="Benchmark lptwitdelete on synthetic archives")
+    parser.add_argument("--data", type=Path, default=Path("bench_data"), help="directory of synthetic archives")
+    parser.add_argument("--tweets", type=int, default=10000, help="number of tweets to generate")
+    parser.add_argument("--dms", type=int, default=1000, help="number of DMs to generate")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each benchmark")
+    parser.add_argument("--no_memory", action="store_true", default=False, help="skip memory profiling")
+    parser.add_argument("--delete_count", type=int, default=1000, help="number of tweets in deletion benchmarks")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API latency per request (seconds)")
+    parser.add_argument("-k", dest="select", default=None, help="only run benchmarks whose names contain this")
+    parser.add_argument("-o", "--outfile", type=Path, default=None, help="write JSON results to this file")
+    parser.add_argument("--compare", type=Path, default=None, help="compare to JSON results from an earlier run")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run benchmarks and report results."""
+    args = parse_cmdline(argv)
+    logging.getLogger("lptwitdelete").setLevel(logging.WARNING)
+
+    if not (args.data / "tweet.js").is_file():
+        print(f"Generating {args.tweets} tweets and {args.dms} DMs in {args.data}...", file=sys.stderr)
+        generate(args.data, args.tweets, args.dms)
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "data": str(args.data),
+        "repeat": args.repeat,
+        "eager_imports": eager_imports(),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as outdir:
+        for name, func in benchmarks(args.data, Path(outdir), args.delete_count, args.latency).items():
+            if args.select and args.select not in name:
+                continue
+            results["results"][name] = measure(func, args.repeat, not args.no_memory)
+            print(f"{name:40} {results['results'][name]['seconds']:10.4f}s", file=sys.stderr)
+
+    if args.outfile:
+        with args.outfile.open("w") as ofh:
+            json.dump(results, ofh, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with args.compare.open("r") as ifh:
+            compare(results, json.load(ifh))
+
+    # Fail if slow imports have crept back into startup
+    if results["eager_imports"]:
+        print(f"Modules imported at startup: {', '.join(results['eager_imports'])}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,468 @@
 # -*- coding: utf-8 -*-
 """Provides code to handle downloaded Twitter archive."""
 
+import io
 import json
 import logging
+import mmap
+import os
+import re
+import zipfile
 
 from argparse import Namespace
-from typing import List
+from collections import deque
+from itertools import chain
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Tuple
 
-from lptwitdelete.filters import filter_tweets, filter_dms
+from lptwitdelete.checkpoint import HighWaterMark, since_args
+from lptwitdelete.filters import check_filters, iter_filter_dms, iter_filter_likes, iter_filter_tweets
+from lptwitdelete.records import DM, TWEET
+from lptwitdelete.metrics import get_metrics
 
+# Size (in characters) of each read from the archive file
+CHUNK_SIZE = 1 << 16
+
+# Whitespace and separators between records in the archive's JSON array
+SEPARATOR_RE = re.compile(r"[\s,]*")
+
+# Boundary between records in an archive's JSON array, when records are written
+# over several lines (as in Twitter archives): a closing brace at the indentation
+# of the records, then a separating comma and the opening brace of the next record
+RECORD_BOUNDARY = rb"\n%s\}\s*,\s*\{"
+
+# Indentation of the first record in an archive's JSON array
+INDENT_RE = re.compile(rb"[ \t]*(?:\r?\n([ \t]*))?")
+
+# Number of chunks per worker process when filtering an archive in parallel, and
+# the minimum size (in bytes) of a chunk
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_SIZE = 1 << 20
+
+# Names of the files holding each type of content in a full (zipped or extracted)
+# Twitter archive, e.g. data/tweets.js, data/tweets-part1.js, ...
+ARCHIVE_PART_RE = {
+    "tweets": re.compile(r"^tweets?(-part(?P<part>\d+))?\.js$"),
+    "dms": re.compile(r"^direct-messages(-part(?P<part>\d+))?\.js$"),
+    "likes": re.compile(r"^like(-part(?P<part>\d+))?\.js$"),
+}
+
+# Key of the records holding each type of content, by which the content of a
+# single-file archive is identified
+CONTENT_KEYS = {"tweets": "tweet", "retweets": "tweet", "dms": "dmConversation", "likes": "like"}
+
+
+def utf8_length(text: str) -> int:
+    """Return the length in bytes of the passed text when encoded as UTF-8."""
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def iter_json_spans(ifh: IO[str], chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[dict, int, int]]:
+    """Yield (element, offset, length) for a JSON array of objects in a filehandle.
+
+    :param ifh:  open text filehandle at the start of the file, with newline=""
+    :param chunk_size:  number of characters to read from the file at a time
+
+    The tweet.js and direct-messages.js archive files start with non-standard
+    text (e.g. window.YTD.tweets.part0 = ) that the JSON parser cannot handle,
+    so anything before the opening bracket of the array is skipped. Only a
+    bounded window of the file is held in memory, so memory use does not grow
+    with the size of the archive.
+
+    The offset and length of each element are in bytes of the UTF-8 encoded
+    file, so that single elements can be read back without parsing the rest.
+    """
+    decoder = json.JSONDecoder()
+
+    # Skip any prefix up to, and including, the opening bracket
+    buf = ifh.read(chunk_size)
+    while "[" not in buf:
+        more = ifh.read(chunk_size)
+        if not more:
+            raise json.JSONDecodeError("Archive contains no JSON array", buf, len(buf))
+        buf += more
+    pos = buf.index("[") + 1
+
+    # Byte offset in the file of the character at index mark in the buffer
+    offset, mark = 0, 0
+    while True:
+        pos = SEPARATOR_RE.match(buf, pos).end()
+        if pos < len(buf):
+            if buf[pos] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                pass
+            else:
+                offset += utf8_length(buf[mark:pos])
+                length = utf8_length(buf[pos:end])
+                yield record, offset, length
+                offset += length
+                pos = mark = end
+                continue
+        # The next record is incomplete: discard consumed text, and read a block at
+        # least as large as the current buffer so that very large records do not
+        # need a quadratic number of retries
+        more = ifh.read(max(chunk_size, len(buf) - pos))
+        if not more:
+            raise json.JSONDecodeError("Unterminated or malformed archive array", buf, pos)
+        offset += utf8_length(buf[mark:pos])
+        buf = buf[pos:] + more
+        pos = mark = 0
+
+
+def iter_json_array(ifh: IO[str], chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """Yield elements of a JSON array of objects one at a time from a filehandle.
+
+    :param ifh:  open text filehandle positioned at, or before, the array
+    :param chunk_size:  number of characters to read from the file at a time
+    """
+    for record, _, _ in iter_json_spans(ifh, chunk_size):
+        yield record
+
+
+def iter_archive_spans(archpath: Path) -> Iterator[Tuple[dict, int, int]]:
+    """Yield (record, offset, length) for records in an archive file.
+
+    :param archpath:  path to tweet.js or direct-messages.js archive file
+    """
+    with archpath.open("r", encoding="utf-8", newline="") as ifh:
+        yield from iter_json_spans(ifh)
+
+
+def iter_archive(archpath: Path) -> Iterator[dict]:
+    """Yield tweet or DM conversation records one at a time from an archive file.
+
+    :param archpath:  path to tweet.js or direct-messages.js archive file
+    """
+    with archpath.open("r", encoding="utf-8", newline="") as ifh:
+        yield from iter_json_array(ifh)
+
+
+def is_multipart(archpath: Path) -> bool:
+    """Return True if the passed path is a full Twitter archive (zip file or directory).
+
+    :param archpath:  path to Twitter archive
+    """
+    return archpath.is_dir() or zipfile.is_zipfile(archpath)
+
+
+def find_archive_parts(archpath: Path, content: str) -> List[str]:
+    """Return names of the files holding the passed content type, in part order.
+
+    :param archpath:  path to zipped or extracted Twitter archive
+    :param content:  type of content to find (a key of ARCHIVE_PART_RE)
+
+    Names are relative to the archive root, and use "/" as a separator.
+    """
+    if archpath.is_dir():
+        names = [_.relative_to(archpath).as_posix() for _ in archpath.rglob("*.js")]
+    else:
+        with zipfile.ZipFile(archpath) as archive:
+            names = archive.namelist()
+
+    parts = []
+    for name in names:
+        match = ARCHIVE_PART_RE[content].match(name.rsplit("/", 1)[-1])
+        if match:
+            parts.append((int(match.group("part") or 0), name))
+    return [name for _, name in sorted(parts)]
+
+
+def parse_archive_part(archpath: Path, name: str) -> List[dict]:
+    """Return all records from a single file in a zipped or extracted archive.
+
+    :param archpath:  path to zipped or extracted Twitter archive
+    :param name:  name of file in the archive
+
+    Zipped files are decompressed in memory, not extracted to disk. This is
+    a module-level function so that it can be run in a worker process.
+    """
+    if archpath.is_dir():
+        return list(iter_archive(archpath / name))
+    with zipfile.ZipFile(archpath) as archive, archive.open(name) as ifh:
+        return list(iter_json_array(io.TextIOWrapper(ifh, encoding="utf-8", newline="")))
+
+
+def iter_archive_parts(archpath: Path, content: str, workers: Optional[int] = None) -> Iterator[dict]:
+    """Yield records of the passed content type from all parts of a full archive.
+
+    :param archpath:  path to zipped or extracted Twitter archive
+    :param content:  type of content to read (a key of ARCHIVE_PART_RE)
+    :param workers:  number of worker processes (defaults to the number of CPUs)
+
+    Parts are parsed in parallel in a process pool, and records are yielded in
+    part order. At most one part per worker is held in memory at a time.
+    """
+    # Slow to import, and only needed for archives of several parts
+    from concurrent.futures import ProcessPoolExecutor
 
-def load_filter_archive(args: Namespace) -> List[dict]:
-    """Load a Twitter archive and filter tweets on the passed options."""
     logger = logging.getLogger(__name__)
 
-    # Load tweet archive
+    parts = find_archive_parts(archpath, content)
+    logger.info("Found %d %s file(s) in archive %s", len(parts), content, archpath)
+    workers = min(workers or os.cpu_count() or 1, len(parts))
+
+    if workers <= 1:
+        for name in parts:
+            yield from parse_archive_part(archpath, name)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: deque = deque()
+        for name in parts:
+            pending.append(pool.submit(parse_archive_part, archpath, name))
+            if len(pending) >= workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def find_chunk_bounds(archpath: Path, nchunks: int) -> List[Tuple[int, int]]:
+    """Return (start, end) byte offsets splitting an archive file's records into chunks.
+
+    :param archpath:  path to tweet.js or direct-messages.js archive file
+    :param nchunks:  maximum number of chunks
+
+    Chunks are split at likely record boundaries, found without parsing the
+    archive. A boundary may fall inside a record, in which case parsing the
+    chunk that ends there fails. Archives written on a single line cannot be
+    split, and form a single chunk.
+    """
+    size = archpath.stat().st_size
+    with archpath.open("rb") as ifh, mmap.mmap(ifh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        starts = [data.find(b"[") + 1]
+        # Records end with a closing brace at the same indentation as the line on
+        # which they start; braces of nested objects are indented further
+        indent = INDENT_RE.match(data, starts[0]).group(1) or b""
+        boundary_re = re.compile(RECORD_BOUNDARY % re.escape(indent))
+        for idx in range(1, nchunks):
+            match = boundary_re.search(data, max(size * idx // nchunks, starts[-1]))
+            if match is None:
+                break
+            if match.end() - 1 > starts[-1]:
+                starts.append(match.end() - 1)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def iter_json_chunk(text: str) -> Iterator[dict]:
+    """Yield records from a chunk of consecutive elements of an archive's JSON array.
+
+    :param text:  chunk text, starting at an element and ending after a separator
+                  or at the end of the array
+
+    Raises ValueError if the chunk does not start and end at element boundaries.
+    """
+    decoder = json.JSONDecoder()
+    pos = SEPARATOR_RE.match(text).end()
+    while pos < len(text):
+        if text[pos] == "]" and not text[pos + 1 :].strip():
+            return
+        record, pos = decoder.raw_decode(text, pos)
+        if not isinstance(record, dict):
+            raise ValueError(f"Archive chunk contains a {type(record).__name__}, not a record")
+        yield record
+        pos = SEPARATOR_RE.match(text, pos).end()
+
+
+def filter_archive_chunk(
+    archpath: Path, start: int, end: int, args: Namespace
+) -> Tuple[str, int, int, Dict[str, Dict]]:
+    """Parse and filter a chunk of an archive file.
+
+    :param archpath:  path to tweet.js or direct-messages.js archive file
+    :param start:  byte offset of the start of the chunk
+    :param end:  byte offset of the end of the chunk
+    :param args:  command-line argument namespace
+
+    Returns the records passing the filters as a JSON array, which is much
+    faster to return from a worker process than the pickled records; the
+    numbers of records and of tweets or messages in the chunk; and the
+    high-water mark of the chunk. This is a module-level function so that it
+    can be run in a worker process.
+    """
+    mark = HighWaterMark()
+    with archpath.open("rb") as ifh:
+        ifh.seek(start)
+        records = list(mark.track(iter_json_chunk(ifh.read(end - start).decode("utf-8"))))
+    if records and "dmConversation" in records[0]:
+        nitems = sum(len(_["dmConversation"]["messages"]) for _ in records)
+        filtered = list(iter_filter_dms(records, args))
+    else:
+        nitems = len(records)
+        filtered = list(iter_filter_tweets(records, args))
+    return json.dumps(filtered, ensure_ascii=False), len(records), nitems, mark.marks
+
+
+def iter_filter_archive_parallel(
+    args: Namespace, dms: bool, mark: Optional[HighWaterMark] = None
+) -> Iterator[dict]:
+    """Return iterator over records from an archive file passing the passed options, filtered in parallel.
+
+    :param args:  command-line argument namespace
+    :param dms:  True if the archive is a direct message archive
+    :param mark:  high-water mark raised for every record in the archive (or None)
+
+    The archive is split into chunks, which are parsed and filtered in a
+    process pool; filtered records are yielded in archive order, so the
+    results are identical to filtering in a single process. If a chunk was
+    not split at a record boundary, the rest of the archive is filtered in
+    this process.
+    """
+    # Slow to import, and only needed for parallel filtering
+    from concurrent.futures import ProcessPoolExecutor
+
+    logger = logging.getLogger(__name__)
+
+    # Check and report the filters here; worker processes filter silently
+    if dms:
+        iter_filter_dms([], args)
+    else:
+        iter_filter_tweets([], args)
+
+    workers = args.workers or os.cpu_count() or 1
+    size = args.archpath.stat().st_size
+    nchunks = max(min(workers * CHUNKS_PER_WORKER, size // MIN_CHUNK_SIZE), 1)
+    bounds = find_chunk_bounds(args.archpath, nchunks)
+    workers = min(workers, len(bounds))
+    logger.info("Filtering archive in %d chunks with %d processes...", len(bounds), workers)
+
+    def iter_chunks():
+        nrecords, nitems = 0, 0
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=logging.disable, initargs=(logging.CRITICAL,)
+        ) as pool:
+            pending: deque = deque()
+            chunks = iter(bounds)
+            while True:
+                # Keep up to two chunks per worker queued, so that workers are never idle
+                for start, end in chunks:
+                    pending.append((start, pool.submit(filter_archive_chunk, args.archpath, start, end, args)))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                start, future = pending.popleft()
+                try:
+                    text, chunk_records, chunk_items, chunk_marks = future.result()
+                except ValueError:
+                    logger.warning("Could not split archive at byte %d; filtering the rest serially", start)
+                    for _, future in pending:
+                        future.cancel()
+                    pending.clear()
+                    chunks = iter([])
+                    text, chunk_records, chunk_items, chunk_marks = filter_archive_chunk(
+                        args.archpath, start, size, args
+                    )
+                nrecords += chunk_records
+                nitems += chunk_items
+                if mark is not None:
+                    mark.update(HighWaterMark(chunk_marks))
+                yield from json.loads(text)
+        if dms:
+            logger.info("Identified %s messages in %s conversations", nitems, nrecords)
+
+    return iter_chunks()
+
+
+def iter_filter_archive(args: Namespace, mark: Optional[HighWaterMark] = None) -> Iterator[dict]:
+    """Load a Twitter archive and return iterator over records passing the passed options.
+
+    :param args:  command-line argument namespace
+    :param mark:  high-water mark from a previous run, raised for every record in the archive
+
+    Retweets are tweets that are retweets, wrapped as retweet records so that
+    they are undone rather than deleted. With --content all, the tweets, DMs
+    and likes of a full archive are filtered in turn, and every filter given
+    must apply to all three.
+    """
+    logger = logging.getLogger(__name__)
+
+    if args.content == "all" and is_multipart(args.archpath):
+        for content in ("tweets", "dms", "likes"):
+            check_filters(args, content)
+        logger.info("Loading tweets, DMs and likes from %s...", args.archpath)
+        return chain.from_iterable(
+            iter_filter_content(Namespace(**{**vars(args), "content": content}), mark)
+            for content in ("tweets", "dms", "likes")
+        )
+    if args.content == "retweets":
+        tweets = iter_filter_content(Namespace(**{**vars(args), "is_retweet": True}), mark)
+        return ({"retweet": _["tweet"]} for _ in tweets if "tweet" in _)
+    return iter_filter_content(args, mark)
+
+
+def iter_filter_content(args: Namespace, mark: Optional[HighWaterMark] = None) -> Iterator[dict]:
+    """Load tweets, DMs or likes from a Twitter archive and return iterator over those passing the passed options.
+
+    :param args:  command-line argument namespace
+    :param mark:  high-water mark from a previous run, raised for every record in the archive
+
+    The archive is opened, and its type identified, immediately; records are
+    then parsed and filtered lazily as the iterator is consumed. Records with
+    IDs up to the passed mark are skipped.
+    """
+    logger = logging.getLogger(__name__)
+
+    # Filter on the cached binary index of the archive, if requested; imported here
+    # so that numpy is only loaded when it is used
+    multipart = is_multipart(args.archpath)
+    if args.cache_dir is not None and not multipart and args.content in ("tweets", "retweets", "all"):
+        from lptwitdelete.cache import load_filter_cached
+
+        tweets = load_filter_cached(since_args(args, mark, TWEET), mark)
+        if tweets is not None:
+            return iter(tweets)
+
+    # Stream records from the tweet archive; only records passing the filters are
+    # held in memory
     logger.info("Parsing Twitter archive in %s...", args.archpath)
-    with args.archpath.open("r") as ifh:
-        # The tweet.js file starts with non-standard text (window.YTD.tweet.part0 = )
-        # that the JSON parser cannot handle, so we need to strip this before parsing
-        firstline = ifh.readline()
-        if firstline.startswith("window.YTD.tweets.part0"):
-            ifh.seek(26, 0)
-        elif firstline.startswith("window.YTD.direct_messages.part0"):
-            ifh.seek(35, 0)
-        else:
-            ifh.seek(0, 0)
-        tweets = json.load(ifh)
-        logger.debug("Loaded %s tweets", len(tweets))
-
-    if "dmConversation" in tweets[0]:
+    if multipart:
+        # Retweets are found among the tweets
+        content = "tweets" if args.content == "retweets" else args.content
+        records = iter_archive_parts(args.archpath, content, args.workers)
+    else:
+        records = iter_archive(args.archpath)
+    records = get_metrics().timed(records, "parse")
+    first = next(records, None)
+    if first is None:
+        logger.warning("Archive %s contains no records", args.archpath)
+        return iter([])
+    records = chain([first], records)
+
+    # The content of a single-file archive is taken from its records by default, but
+    # an archive not holding the content asked for is an error, so that (say) tweets
+    # are not deleted when DMs or likes were asked for
+    key = CONTENT_KEYS.get(args.content)
+    if args.content != "tweets" and key is not None and key not in first:
+        logger.error("Archive %s does not hold %s (exiting)", args.archpath, args.content)
+        raise SystemError(1)
+
+    # Likes are not ordered by ID, so are never skipped by ID, and are cheap enough
+    # to filter that they are never filtered in parallel
+    if "like" in first:
+        logger.info("Archive is a like archive, not a tweet archive")
+        return iter_filter_likes(records, args)
+
+    # Skip records processed by a previous run, and raise the mark for every record
+    dms = "dmConversation" in first
+    args = since_args(args, mark, DM if dms else TWEET)
+
+    # Filter single-file archives in chunks in a process pool, if requested; the
+    # columnar filter needs all the records at once
+    if args.parallel and not multipart and not args.columnar:
+        return iter_filter_archive_parallel(args, dms, mark)
+
+    if mark is not None:
+        records = mark.track(records)
+    if dms:
         logger.info("Archive is a direct message archive, not a tweet archive")
-        return filter_dms(list(tweets), args)
+        return iter_filter_dms(records, args)
     else:
-        return filter_tweets(list(tweets), args)
+        return iter_filter_tweets(records, args)
+
+
+def load_filter_archive(args: Namespace) -> List[dict]:
+    """Load a Twitter archive and filter tweets, DMs, likes or retweets on the passed options."""
+    return list(iter_filter_archive(args))
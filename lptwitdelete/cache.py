@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Persistent binary index of parsed tweet archives, for filtering without parsing JSON."""
+
+import hashlib
+import json
+import logging
+import mmap
+import shutil
+import tempfile
+
+from argparse import Namespace
+from pathlib import Path
+from typing import Optional, List
+
+from lptwitdelete.archive import iter_archive_spans
+from lptwitdelete.checkpoint import HighWaterMark
+from lptwitdelete.filters import check_filters
+from lptwitdelete.records import TWEET
+from lptwitdelete.table import COLUMNS, TweetTable, np, tweet_row
+from lptwitdelete.textindex import TextIndex
+
+# Version of the on-disk cache layout; bump to invalidate existing caches
+CACHE_VERSION = 2
+
+# Size of each block read when hashing archive contents (bytes)
+HASH_BLOCK_SIZE = 1 << 20
+
+
+class ArchiveRecords:
+
+    """Sequence of archive records read lazily from byte offsets in the archive file.
+
+    The archive is memory-mapped, so only records that are accessed are parsed.
+    """
+
+    def __init__(self, archpath: Path, offsets: "np.ndarray", lengths: "np.ndarray") -> None:
+        """Create a lazy sequence of records.
+
+        :param archpath:  path to archive file
+        :param offsets:  byte offset of each record in the archive file
+        :param lengths:  length in bytes of each record in the archive file
+        """
+        self.archpath = archpath
+        self.offsets = offsets
+        self.lengths = lengths
+        self._mmap = None
+
+    def __len__(self) -> int:
+        """Return the number of records in the archive."""
+        return len(self.offsets)
+
+    def __getitem__(self, idx: int) -> dict:
+        """Parse and return the record at the passed index."""
+        if self._mmap is None:
+            with self.archpath.open("rb") as ifh:
+                self._mmap = mmap.mmap(ifh.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = int(self.offsets[idx])
+        return json.loads(self._mmap[offset : offset + int(self.lengths[idx])])
+
+
+def cache_key(archpath: Path) -> str:
+    """Return cache key for the archive at the passed path.
+
+    :param archpath:  path to archive file
+
+    The key combines the resolved path, size, modification time and a hash
+    of the file contents.
+    """
+    content = hashlib.blake2b()
+    with archpath.open("rb") as ifh:
+        for block in iter(lambda: ifh.read(HASH_BLOCK_SIZE), b""):
+            content.update(block)
+    stat = archpath.stat()
+    key = f"{CACHE_VERSION}:{archpath.resolve()}:{stat.st_size}:{stat.st_mtime_ns}:{content.hexdigest()}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def build_index(archpath: Path, indexdir: Path) -> bool:
+    """Parse the archive and write its binary and text indexes to the passed directory.
+
+    :param archpath:  path to tweet archive file
+    :param indexdir:  directory to hold the index
+
+    Returns False, without writing an index, if the archive is not a tweet
+    archive. The index is written to a temporary directory that is renamed
+    into place, so an interrupted build never leaves a partial index.
+    """
+    rows, offsets, lengths = [], [], []
+    text_index = TextIndex()
+    for record, offset, length in iter_archive_spans(archpath):
+        if "tweet" not in record:
+            return False
+        text_index.add(len(rows), record)
+        rows.append(tweet_row(record))
+        offsets.append(offset)
+        lengths.append(length)
+
+    indexdir.parent.mkdir(parents=True, exist_ok=True)
+    tmpdir = Path(tempfile.mkdtemp(dir=indexdir.parent))
+    try:
+        for idx, (name, dtype) in enumerate(COLUMNS.items()):
+            np.save(tmpdir / f"{name}.npy", np.fromiter((_[idx] for _ in rows), dtype=dtype, count=len(rows)))
+        np.save(tmpdir / "offset.npy", np.array(offsets, dtype="int64"))
+        np.save(tmpdir / "length.npy", np.array(lengths, dtype="int64"))
+        text_index.save(tmpdir)
+        with (tmpdir / "meta.json").open("w") as ofh:
+            json.dump({"version": CACHE_VERSION, "archpath": str(archpath.resolve()), "records": len(rows)}, ofh)
+        tmpdir.rename(indexdir)
+    finally:
+        if tmpdir.exists():
+            shutil.rmtree(tmpdir)
+    return True
+
+
+def load_index(archpath: Path, indexdir: Path) -> TweetTable:
+    """Return a TweetTable backed by the memory-mapped index in the passed directory.
+
+    :param archpath:  path to tweet archive file
+    :param indexdir:  directory holding the index
+    """
+    columns = {name: np.load(indexdir / f"{name}.npy", mmap_mode="r") for name in COLUMNS}
+    records = ArchiveRecords(
+        archpath,
+        np.load(indexdir / "offset.npy", mmap_mode="r"),
+        np.load(indexdir / "length.npy", mmap_mode="r"),
+    )
+    return TweetTable(columns, records, TextIndex(indexdir))
+
+
+def load_filter_cached(args: Namespace, mark: Optional[HighWaterMark] = None) -> Optional[List[dict]]:
+    """Filter a tweet archive using its cached index, building the index if needed.
+
+    :param args:  command-line argument namespace
+    :param mark:  high-water mark raised to the newest tweet in the archive (or None)
+
+    Returns None if the archive is not a tweet archive, and cannot be cached.
+    """
+    logger = logging.getLogger(__name__)
+
+    if np is None:
+        logger.error("Archive caching requires numpy to be installed (exiting)")
+        raise SystemError(1)
+
+    indexdir = args.cache_dir / cache_key(args.archpath)
+    if indexdir.is_dir():
+        logger.info("Using cached archive index in %s", indexdir)
+    else:
+        logger.info("Building archive index in %s...", indexdir)
+        if not build_index(args.archpath, indexdir):
+            logger.info("Archive %s is not a tweet archive; not caching", args.archpath)
+            return None
+    check_filters(args, "tweets")
+
+    table = load_index(args.archpath, indexdir)
+    logger.debug("Loaded index of %s tweets", len(table))
+    if mark is not None and len(table):
+        newest = int(np.argmax(table["id"]))
+        mark.observe(TWEET, int(table["id"][newest]), int(table["timestamp"][newest]))
+    return table.select(table.mask(args))
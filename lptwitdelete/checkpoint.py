@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Checkpoints recording the newest tweets and DMs processed by previous runs."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from argparse import Namespace
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from lptwitdelete.filters import parse_created_at, parse_created_at_iso
+from lptwitdelete.records import DM, TWEET
+
+# Version of the checkpoint file format
+CHECKPOINT_VERSION = 1
+
+# Command-line options defining the set of tweets or DMs a run processes; each
+# combination of these options has its own checkpoint
+FILTER_OPTIONS = (
+    "content",
+    "start_date",
+    "end_date",
+    "is_retweet",
+    "is_reply",
+    "filter",
+    "text",
+    "hashtag",
+    "mention",
+    "domain",
+    "regex",
+    "conversation",
+    "sender",
+)
+
+# Serialises updates to checkpoint files by concurrent accounts in batch mode
+_file_lock = threading.Lock()
+
+
+def filter_key(args: Namespace) -> str:
+    """Return key identifying the set of filters in the passed arguments.
+
+    :param args:  command-line argument namespace
+    """
+    options = json.dumps({_: getattr(args, _) for _ in FILTER_OPTIONS}, sort_keys=True, default=str)
+    return hashlib.sha1(options.encode("utf-8")).hexdigest()[:16]
+
+
+class HighWaterMark:
+
+    """Greatest ID, with its creation time, of the tweets and DMs seen in a run.
+
+    Tweet and DM IDs increase with time, so every record with an ID up to the
+    mark was already seen. Tweets and DMs are marked separately.
+    """
+
+    def __init__(self, marks: Optional[Dict[str, Dict]] = None) -> None:
+        """Create mark from a dictionary of record kind to max_id and timestamp.
+
+        :param marks:  marks loaded from a checkpoint file
+        """
+        self.marks: Dict[str, Dict] = {}
+        for kind, mark in (marks or {}).items():
+            self.observe(kind, int(mark["max_id"]), mark.get("timestamp"))
+
+    def since(self, kind: str) -> Optional[int]:
+        """Return greatest ID seen for the passed kind of record, or None."""
+        mark = self.marks.get(kind)
+        return None if mark is None else mark["max_id"]
+
+    def observe(self, kind: str, record_id: int, timestamp: Optional[int] = None) -> bool:
+        """Raise the mark for a kind of record to the passed ID, and return True, if it is greater.
+
+        :param kind:  kind of record (TWEET or DM)
+        :param record_id:  ID of the record
+        :param timestamp:  UNIX time at which the record was created
+        """
+        mark = self.marks.get(kind)
+        if mark is not None and record_id <= mark["max_id"]:
+            return False
+        self.marks[kind] = {"max_id": record_id, "timestamp": timestamp}
+        return True
+
+    def lower(self, kind: str, record_id: int) -> None:
+        """Lower the mark for a kind of record below the passed ID, so that a later run processes it again.
+
+        :param kind:  kind of record (TWEET or DM)
+        :param record_id:  ID of the record
+        """
+        mark = self.marks.get(kind)
+        if mark is not None and record_id <= mark["max_id"]:
+            self.marks[kind] = {"max_id": record_id - 1, "timestamp": None}
+
+    def observe_record(self, record: dict) -> None:
+        """Raise the mark for the passed tweet, DM, or DM conversation record.
+
+        Creation times are only parsed for records that raise the mark.
+        """
+        if "tweet" in record:
+            tweet = record["tweet"]
+            if self.observe(TWEET, int(tweet["id_str"])):
+                self.marks[TWEET]["timestamp"] = parse_created_at(tweet["created_at"])
+        elif "dmConversation" in record:
+            for message in record["dmConversation"]["messages"]:
+                self.observe_record(message)
+        else:
+            for key in ("messageCreate", "welcomeMessageCreate"):
+                if key in record:
+                    message = record[key]
+                    if self.observe(DM, int(message["id"])):
+                        self.marks[DM]["timestamp"] = parse_created_at_iso(message["createdAt"])
+
+    def track(self, records: Iterable[dict]) -> Iterator[dict]:
+        """Yield the passed records, raising the mark for each."""
+        for record in records:
+            self.observe_record(record)
+            yield record
+
+    def update(self, other: "HighWaterMark") -> None:
+        """Raise this mark to the passed mark, where that is greater."""
+        for kind, mark in other.marks.items():
+            self.observe(kind, mark["max_id"], mark["timestamp"])
+
+    def as_dict(self) -> Dict[str, Dict]:
+        """Return mark as a JSON-serialisable dictionary."""
+        return {
+            kind: {"max_id": str(mark["max_id"]), "timestamp": mark["timestamp"]} for kind, mark in self.marks.items()
+        }
+
+
+def since_args(args: Namespace, mark: Optional[HighWaterMark], kind: str) -> Namespace:
+    """Return arguments with since_id raised to the passed mark for a kind of record.
+
+    :param args:  command-line argument namespace
+    :param mark:  high-water mark from a previous run (or None)
+    :param kind:  kind of record being processed (TWEET or DM)
+    """
+    since = None if mark is None else mark.since(kind)
+    if since is None or (args.since_id is not None and args.since_id >= since):
+        return args
+    return Namespace(**{**vars(args), "since_id": since})
+
+
+class CheckpointFile:
+
+    """JSON file of high-water marks, for each account and set of filters."""
+
+    def __init__(self, path: Path) -> None:
+        """Use the checkpoint file at the passed path, which need not exist yet.
+
+        :param path:  path to checkpoint file
+        """
+        self.path = path
+
+    def _load(self) -> Dict:
+        """Return contents of the checkpoint file."""
+        logger = logging.getLogger(__name__)
+
+        if not self.path.is_file():
+            return {"version": CHECKPOINT_VERSION, "checkpoints": {}}
+        try:
+            with self.path.open("r", encoding="utf-8") as ifh:
+                data = json.load(ifh)
+        except ValueError:
+            logger.error("Could not read checkpoint file %s (exiting)", self.path, exc_info=True)
+            raise SystemError(1)
+        if data.get("version") != CHECKPOINT_VERSION:
+            logger.error("Checkpoint file %s has an unsupported version (exiting)", self.path)
+            raise SystemError(1)
+        return data
+
+    def get(self, username: str, args: Namespace) -> HighWaterMark:
+        """Return the mark saved for the passed account and filters, if any.
+
+        :param username:  Twitter username
+        :param args:  command-line argument namespace
+        """
+        with _file_lock:
+            data = self._load()
+        entry = data["checkpoints"].get(username, {}).get(filter_key(args), {})
+        return HighWaterMark(entry.get("marks"))
+
+    def set(self, username: str, args: Namespace, mark: HighWaterMark) -> None:
+        """Save the mark for the passed account and filters.
+
+        :param username:  Twitter username
+        :param args:  command-line argument namespace
+        :param mark:  high-water mark to save
+
+        Other entries in the file are preserved. The file is written to a
+        temporary file and renamed into place, so an interrupted run never
+        leaves a partial checkpoint.
+        """
+        with _file_lock:
+            data = self._load()
+            data["checkpoints"].setdefault(username, {})[filter_key(args)] = {
+                "filters": {_: getattr(args, _) for _ in FILTER_OPTIONS},
+                "updated": datetime.now().isoformat(timespec="seconds"),
+                "marks": mark.as_dict(),
+            }
+            tmppath = self.path.with_name(self.path.name + ".tmp")
+            with tmppath.open("w", encoding="utf-8") as ofh:
+                json.dump(data, ofh, indent=2, default=str)
+            os.replace(tmppath, self.path)
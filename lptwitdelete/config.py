@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import yaml
 
 from pathlib import Path
+from typing import Dict, List
+
+# Keys holding API credentials in the config file
+KEY_NAMES = ("api_key", "api_secret_key", "access_token", "access_token_secret")
 
 
 class Config:
@@ -17,17 +20,50 @@ class Config:
     USERNAME = ""
 
     def __init__(self, username: str, confpath: Path) -> None:
-        """Use local configuration information for the Twitter account with passed username."""
+        """Use local configuration information for the Twitter account with passed username.
+
+        Keys in the lptwitdelete section are used for every account, but may be
+        overridden by the account's entry in the optional accounts section. Any
+        other values in the account's entry are kept in OPTIONS.
+        """
         logger = logging.getLogger(__name__)
 
-        with confpath.open("r") as ifh:
-            try:
-                confdata = yaml.safe_load(ifh)
-                self.CONSUMER_KEY = confdata["lptwitdelete"]["api_key"]
-                self.CONSUMER_SECRET = confdata["lptwitdelete"]["api_secret_key"]
-                self.ACCESS_KEY = confdata["lptwitdelete"]["access_token"]
-                self.ACCESS_SECRET = confdata["lptwitdelete"]["access_token_secret"]
-                self.USERNAME = username
-            except yaml.YAMLError:
-                logger.error("Error loading config file %s (exiting)", confpath, exc_info=True)
-                raise SystemError(1)
+        confdata = load_config(confpath)
+        keys = dict(confdata.get("lptwitdelete") or {})
+        account = dict((confdata.get("accounts") or {}).get(username) or {})
+        keys.update({_: account.pop(_) for _ in KEY_NAMES if _ in account})
+        try:
+            self.CONSUMER_KEY = keys["api_key"]
+            self.CONSUMER_SECRET = keys["api_secret_key"]
+            self.ACCESS_KEY = keys["access_token"]
+            self.ACCESS_SECRET = keys["access_token_secret"]
+        except KeyError as exc:
+            logger.error("No %s for %s in config file %s (exiting)", exc, username, confpath)
+            raise SystemError(1)
+        self.USERNAME = username
+        self.OPTIONS: Dict = account
+
+
+def load_config(confpath: Path) -> Dict:
+    """Return parsed contents of the YAML config file at the passed path.
+
+    :param confpath:  path to config file
+    """
+    import yaml  # slow to import, and only needed when authenticating
+
+    logger = logging.getLogger(__name__)
+
+    with confpath.open("r") as ifh:
+        try:
+            return yaml.safe_load(ifh) or {}
+        except yaml.YAMLError:
+            logger.error("Error loading config file %s (exiting)", confpath, exc_info=True)
+            raise SystemError(1)
+
+
+def config_accounts(confpath: Path) -> List[str]:
+    """Return usernames of all accounts in the accounts section of the passed config file.
+
+    :param confpath:  path to config file
+    """
+    return [str(_) for _ in (load_config(confpath).get("accounts") or {})]
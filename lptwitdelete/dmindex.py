@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Flattened, typed index of the messages in a direct message archive."""
+
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from lptwitdelete.filters import parse_created_at_iso
+
+# Kinds of message in a DM conversation, in order of their codes in the index
+KINDS = ("messageCreate", "welcomeMessageCreate")
+
+# Code for conversation events that are not messages (e.g. participants joining)
+OTHER_KIND = -1
+
+# Placeholder for missing message IDs, senders and creation times
+MISSING = -(2**63)
+
+
+def id_value(value: Optional[str]) -> int:
+    """Return integer value of a numeric ID string, or MISSING."""
+    return int(value) if isinstance(value, str) and value.isdigit() else MISSING
+
+
+class DMIndex:
+
+    """Messages from all DM conversations, flattened into typed columns.
+
+    Each row holds one message's ID, conversation, sender, kind and creation
+    time, in archive order, alongside the message record. Rows for each
+    conversation and sender are indexed, so that their messages are found
+    without scanning the archive.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty index."""
+        self.ids = array("q")
+        self.conversations = array("l")
+        self.senders = array("q")
+        self.kinds = array("b")
+        self.timestamps = array("q")
+        self.messages: List[dict] = []
+        self.conversation_ids: List[str] = []
+        self.by_conversation: Dict[str, List[int]] = {}
+        self.by_sender: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        """Return the number of messages in the index."""
+        return len(self.messages)
+
+    def add_conversation(self, conversation: dict) -> None:
+        """Add the messages in a DM conversation record to the index.
+
+        :param conversation:  JSON dict for DM conversation
+        """
+        conversation = conversation["dmConversation"]
+        code = len(self.conversation_ids)
+        self.conversation_ids.append(conversation.get("conversationId", ""))
+        rows = self.by_conversation.setdefault(self.conversation_ids[-1], [])
+        for message in conversation["messages"]:
+            if KINDS[0] in message:
+                kind, fields = 0, message[KINDS[0]]
+            elif KINDS[1] in message:
+                kind, fields = 1, message[KINDS[1]]
+            else:
+                kind, fields = OTHER_KIND, {}
+            created_at = fields.get("createdAt")
+            sender = id_value(fields.get("senderId"))
+
+            row = len(self.messages)
+            self.ids.append(id_value(fields.get("id")))
+            self.conversations.append(code)
+            self.senders.append(sender)
+            self.kinds.append(kind)
+            self.timestamps.append(MISSING if created_at is None else parse_created_at_iso(created_at))
+            self.messages.append(message)
+            rows.append(row)
+            if sender != MISSING:
+                self.by_sender.setdefault(sender, []).append(row)
+
+    @classmethod
+    def from_conversations(cls, conversations: Iterable[dict]) -> "DMIndex":
+        """Return index of the messages in the passed DM conversations.
+
+        :param conversations:  iterable of JSON format DM conversations
+        """
+        index = cls()
+        for conversation in conversations:
+            index.add_conversation(conversation)
+        return index
+
+    def select(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        conversations: Optional[Iterable[str]] = None,
+        senders: Optional[Iterable[str]] = None,
+        after_id: Optional[int] = None,
+    ) -> List[int]:
+        """Return rows, in archive order, of messages matching all the passed criteria.
+
+        :param start:  UNIX time on or after which messages must be sent (or None)
+        :param end:  UNIX time on or before which messages must be sent (or None)
+        :param conversations:  IDs of conversations containing the messages (or None)
+        :param senders:  user IDs of the senders of the messages (or None)
+        :param after_id:  ID which message IDs must be greater than (or None)
+
+        Candidate rows are found by conversation or sender, where given, and
+        only those rows are checked against the remaining criteria. Messages
+        with no creation time never match a date.
+        """
+        sender_ids = None if senders is None else {id_value(_) for _ in senders}
+        if conversations is not None:
+            rows: Iterable[int] = sorted(row for _ in set(conversations) for row in self.by_conversation.get(_, []))
+        elif sender_ids is not None:
+            rows = sorted(row for _ in sender_ids for row in self.by_sender.get(_, []))
+            sender_ids = None
+        else:
+            rows = range(len(self))
+
+        if sender_ids is not None:
+            rows = [_ for _ in rows if self.senders[_] in sender_ids]
+        if start is not None or end is not None:
+            low = MISSING + 1 if start is None else start
+            high = -MISSING - 1 if end is None else end
+            rows = [_ for _ in rows if low <= self.timestamps[_] <= high]
+        if after_id is not None:
+            rows = [_ for _ in rows if self.ids[_] > after_id]
+        return list(rows)
+
+    def undated(self) -> List[int]:
+        """Return rows of messages with no creation time."""
+        return [row for row, timestamp in enumerate(self.timestamps) if timestamp == MISSING]
+
+    def records(self, rows: Iterable[int]) -> List[dict]:
+        """Return message records for the passed rows.
+
+        :param rows:  row numbers in the index
+        """
+        return [self.messages[_] for _ in rows]
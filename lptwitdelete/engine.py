@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""Concurrent, rate-limit-aware engine for issuing deletions against an API."""
+
+import heapq
+import logging
+import random
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Tuple, Type
+
+from lptwitdelete.metrics import Metrics, get_metrics
+from lptwitdelete.records import Record
+
+# Wait applied when the API reports rate-limiting without a reset time (seconds);
+# Twitter rate-limit windows are 15 minutes long
+DEFAULT_RATE_LIMIT_WAIT = 15 * 60
+
+# Number of times a deletion that failed with a transient error is retried
+MAX_RETRIES = 5
+
+# Base and maximum delay before retrying a failed deletion (seconds)
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+# Twitter API error codes for statuses or messages that do not exist (i.e. have
+# already been deleted): 34 "page does not exist", 144 "no status found"
+GONE_API_CODES = {34, 144}
+
+# Outcomes of deletion attempts
+DELETED = "deleted"
+GONE = "gone"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+FAILED = "failed"
+
+
+class TokenBucket:
+
+    """Thread-safe token bucket shared by all deletion workers.
+
+    The bucket starts unconstrained and learns the API quota from rate-limit
+    headers: the requests remaining in the current window are spread evenly
+    over the time left until the window resets, so workers keep as close to
+    the quota as possible without exhausting it early.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        capacity: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = time.sleep,
+    ) -> None:
+        """Create a token bucket.
+
+        :param rate:  tokens added per second (None for no limit)
+        :param capacity:  maximum number of tokens held (i.e. burst size)
+        :param clock:  monotonic clock function, in seconds
+        :param sleep:  function used to wait, in seconds
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        """Add tokens accrued since the last refill."""
+        if self.rate is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Block until a token is available, and return the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                wait_for = self.paused_until - now
+                if wait_for <= 0:
+                    if self.rate is None:
+                        return waited
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    wait_for = (1 - self.tokens) / self.rate
+            self._sleep(wait_for)
+            waited += wait_for
+
+    def pause(self, seconds: float) -> None:
+        """Stop issuing tokens for the passed number of seconds."""
+        with self._lock:
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, self._clock() + seconds)
+
+    def update(self, remaining: int, reset: float) -> None:
+        """Update the bucket from the API's reported quota.
+
+        :param remaining:  requests remaining in the current rate-limit window
+        :param reset:  UNIX time at which the rate-limit window resets
+        """
+        window = max(reset - time.time(), 1.0)
+        if remaining <= 0:
+            self.pause(window)
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = max(remaining, 1) / window
+            self.tokens = min(self.tokens, float(max(remaining, 0)))
+
+
+def rate_limit_headers(response: Any) -> Optional[Tuple[int, float]]:
+    """Return (remaining, reset) from an HTTP response's rate-limit headers, or None.
+
+    :param response:  HTTP response object with a headers mapping
+    """
+    headers: Mapping = getattr(response, "headers", None) or {}
+    headers = {str(key).lower(): value for key, value in headers.items()}
+    try:
+        return (
+            int(headers["x-rate-limit-remaining"]),
+            float(headers["x-rate-limit-reset"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def classify_error(exc: BaseException) -> str:
+    """Return whether a failed deletion is TRANSIENT, GONE or PERMANENT.
+
+    :param exc:  exception raised by the failed request
+
+    Rate-limited (HTTP 429) and server (HTTP 5xx) errors, and errors with no
+    HTTP response (e.g. dropped connections), are transient and worth
+    retrying. Requests for statuses or messages that no longer exist will
+    never succeed, and nor will other client errors.
+    """
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None or status == 429 or status >= 500:
+        return TRANSIENT
+    if status == 404 or GONE_API_CODES.intersection(getattr(exc, "api_codes", None) or []):
+        return GONE
+    return PERMANENT
+
+
+class DeletionEngine:
+
+    """Issue deletions from a bounded pool of worker threads.
+
+    All workers share a TokenBucket for each API endpoint, which is updated
+    from the rate-limit headers of each response to that endpoint. Requests
+    rejected with HTTP 429 pause the endpoint's bucket until its rate-limit
+    window resets; requests to other endpoints continue.
+
+    Failed deletions are classified with classify_error(). Transient failures
+    are placed on a retry queue, and reissued after an exponential backoff
+    with jitter, alongside new deletions; records that no longer exist, or
+    that failed permanently, are never retried.
+    """
+
+    def __init__(
+        self,
+        delete: Callable[[Record], Any],
+        concurrency: int = 1,
+        bucket: Optional[TokenBucket] = None,
+        bucket_key: Callable[[Record], Hashable] = lambda record: None,
+        errors: Tuple[Type[BaseException], ...] = (Exception,),
+        on_complete: Callable[[Record, str], Any] = lambda record, outcome: None,
+        metrics: Optional[Metrics] = None,
+        classify: Callable[[BaseException], str] = classify_error,
+        max_retries: int = MAX_RETRIES,
+    ) -> None:
+        """Create a deletion engine.
+
+        :param delete:  callable that deletes a single record via the API, returning
+                        the HTTP response to the request (or None if unknown)
+        :param concurrency:  number of worker threads issuing requests
+        :param bucket:  token bucket shared by the workers, for records whose bucket_key is None
+        :param bucket_key:  callable returning the endpoint (or other key) whose
+                            token bucket limits deletion of a record
+        :param errors:  exception types that indicate a failed deletion
+        :param on_complete:  callback called in the calling thread with each
+                             record, and its outcome (DELETED, GONE or FAILED)
+        :param metrics:  metrics collection recording request latencies, and
+                         counts of deletes, skips, retries and rate-limit waits
+        :param classify:  callable classifying errors as TRANSIENT, GONE or PERMANENT
+        :param max_retries:  maximum number of times a transient failure is retried
+        """
+        self.delete = delete
+        self.concurrency = max(concurrency, 1)
+        self.bucket = bucket if bucket is not None else TokenBucket(capacity=self.concurrency)
+        self.bucket_key = bucket_key
+        self.buckets: Dict[Hashable, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.errors = errors
+        self.on_complete = on_complete
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.classify = classify
+        self.max_retries = max_retries
+
+    def bucket_for(self, record: Record) -> TokenBucket:
+        """Return the token bucket limiting deletion of the passed record, creating it if necessary."""
+        key = self.bucket_key(record)
+        with self._lock:
+            if key not in self.buckets:
+                self.buckets[key] = self.bucket if key is None else TokenBucket(capacity=self.concurrency)
+            return self.buckets[key]
+
+    def _delete(self, record: Record, attempt: int) -> Tuple[Record, str, int]:
+        """Make one attempt to delete a record, waiting on the token bucket; run in a worker."""
+        logger = logging.getLogger(__name__)
+
+        bucket = self.bucket_for(record)
+        waited = bucket.acquire()
+        if waited:
+            self.metrics.count("rate_limit_waits")
+            self.metrics.observe("rate_limit_wait_seconds", waited)
+        time0 = time.perf_counter()
+        try:
+            response = self.delete(record)
+        except self.errors as exc:
+            self.metrics.observe("api_request_seconds", time.perf_counter() - time0)
+            response = getattr(exc, "response", None)
+            if getattr(response, "status_code", None) == 429:
+                self.metrics.count("rate_limited")
+                quota = rate_limit_headers(response)
+                if quota is None:
+                    bucket.pause(DEFAULT_RATE_LIMIT_WAIT)
+                else:
+                    bucket.update(0, quota[1])
+                logger.debug("Rate limited; waiting for rate-limit window to reset")
+            outcome = self.classify(exc)
+            logger.debug("Could not delete %s (%s): %s", record, outcome, exc)
+            return record, outcome, attempt
+        self.metrics.observe("api_request_seconds", time.perf_counter() - time0)
+        quota = rate_limit_headers(response)
+        if quota is not None:
+            bucket.update(*quota)
+        return record, DELETED, attempt
+
+    def backoff(self, attempt: int) -> float:
+        """Return delay before retrying a record that has failed the passed number of times.
+
+        Delays grow exponentially up to BACKOFF_CAP, with "full jitter" (a
+        uniformly random fraction of the delay), so that retries of records
+        that failed together are spread out.
+        """
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+    def run(self, records: Iterable[Record]) -> List[Record]:
+        """Delete the passed records and return those that could not be deleted.
+
+        :param records:  iterable of records for deletion
+
+        At most twice as many requests as there are workers are queued at any
+        time, so records may be produced lazily. Records that no longer exist
+        are not returned.
+
+        When records are deleted through several endpoints, records for an
+        endpoint paused by its rate limit are held back until it resumes, so
+        that workers are not left waiting while other endpoints have quota.
+        """
+        failed: List[Record] = []
+        retries: List[Tuple[float, int, Record, int]] = []  # heap of (due, seq, record, attempt)
+        records = iter(records)
+        exhausted = False
+        seq = 0
+
+        def submit(pool, pending: set, record: Record, attempt: int) -> None:
+            nonlocal seq
+            paused_until = self.bucket_for(record).paused_until
+            if len(self.buckets) > 1 and paused_until > time.monotonic():
+                seq += 1
+                heapq.heappush(retries, (paused_until, seq, record, attempt))
+            else:
+                pending.add(pool.submit(self._delete, record, attempt))
+
+        def collect(futures):
+            nonlocal seq
+            for future in futures:
+                record, outcome, attempt = future.result()
+                if outcome == TRANSIENT and attempt < self.max_retries:
+                    self.metrics.count("retries")
+                    seq += 1
+                    heapq.heappush(retries, (time.monotonic() + self.backoff(attempt), seq, record, attempt + 1))
+                    continue
+                if outcome == DELETED:
+                    self.metrics.count("deleted")
+                elif outcome == GONE:
+                    self.metrics.count("gone")
+                else:
+                    outcome = FAILED
+                    self.metrics.count("skipped")
+                    failed.append(record)
+                self.on_complete(record, outcome)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending: set = set()
+            while True:
+                # Queue retries that are due first, then new records
+                while retries and retries[0][0] <= time.monotonic() and len(pending) < 2 * self.concurrency:
+                    _, _, record, attempt = heapq.heappop(retries)
+                    submit(pool, pending, record, attempt)
+                while not exhausted and len(pending) < 2 * self.concurrency:
+                    try:
+                        submit(pool, pending, next(records), 0)
+                    except StopIteration:
+                        exhausted = True
+
+                timeout = max(retries[0][0] - time.monotonic(), 0) if retries else None
+                if not pending:
+                    if timeout is None:
+                        break
+                    time.sleep(timeout)
+                    continue
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        return failed
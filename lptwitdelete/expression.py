@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""Filter expression language for selecting tweets, compiled to a single predicate.
+
+Expressions combine comparisons of tweet fields with and, or, not and
+parentheses, e.g.
+
+    retweet and created < 2020-01-01 and favorite_count < 5
+
+Fields are listed in FIELDS. Values are integers, dates (YYYY-MM-DD, taken as
+local midnight), true or false; a field on its own is true if it is non-zero.
+"""
+
+import logging
+import operator
+import re
+
+from argparse import Namespace
+from collections import Counter
+from typing import Any, Callable, Collection, Dict, List, Optional, Tuple
+
+from lptwitdelete.filters import (
+    TERM_KINDS,
+    date_bounds,
+    has_terms,
+    is_reply,
+    is_retweet,
+    parse_created_at,
+    parse_date,
+    parse_terms,
+    text_search,
+)
+
+# Fields available to filter expressions: (TweetTable column, value for a tweet)
+FIELDS = {
+    "id": ("id", lambda tweet: int(tweet["tweet"]["id_str"])),
+    "created": ("timestamp", lambda tweet: parse_created_at(tweet["tweet"]["created_at"])),
+    "retweet": ("is_retweet", is_retweet),
+    "reply": ("is_reply", is_reply),
+    "reply_to_user": (
+        "reply_to_user",
+        lambda tweet: int(tweet["tweet"].get("in_reply_to_user_id_str") or -1),
+    ),
+    "favorite_count": (
+        "favorite_count",
+        lambda tweet: int(tweet["tweet"].get("favorite_count") or 0),
+    ),
+    "retweet_count": (
+        "retweet_count",
+        lambda tweet: int(tweet["tweet"].get("retweet_count") or 0),
+    ),
+}
+
+# Comparison operators, and their Python equivalents
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+SOURCE_OPERATORS = {"=": "=="}
+
+TOKEN_RE = re.compile(
+    r"\s*(?:(?P<date>\d{4}-\d{2}-\d{2})|(?P<number>-?\d+)|(?P<op><=|>=|==|!=|<|>|=)"
+    r"|(?P<paren>[()])|(?P<name>[A-Za-z_]+))"
+)
+
+# Expressions are parsed to nested tuples: ("field", name), ("literal", value),
+# ("not", node), ("and", node, node), ("or", node, node), ("cmp", op, node, node),
+# and, from command-line options only, ("terms", kind, values) and ("regex", pattern)
+Node = Tuple[Any, ...]
+
+
+class ExpressionError(ValueError):
+
+    """Exception raised for filter expressions that cannot be parsed."""
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    """Return list of (kind, value) tokens in the passed filter expression.
+
+    :param text:  filter expression
+    """
+    tokens: List[Tuple[str, str]] = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ExpressionError(f"Unexpected character {text[pos:].lstrip()[:1]!r} at position {pos}")
+        kind = match.lastgroup or ""
+        value = match.group(kind)
+        if kind == "name" and value.lower() in ("and", "or", "not", "true", "false"):
+            kind, value = "keyword", value.lower()
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+class Parser:
+
+    """Recursive descent parser for filter expressions."""
+
+    def __init__(self, text: str) -> None:
+        """Tokenize the passed filter expression."""
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self) -> Tuple[str, str]:
+        """Return the next token without consuming it, or empty strings at the end of the expression."""
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return "", ""
+
+    def take(self) -> Tuple[str, str]:
+        """Consume and return the next token."""
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self) -> Node:
+        """Return the parsed expression."""
+        node = self.parse_or()
+        if self.pos < len(self.tokens):
+            raise ExpressionError(f"Unexpected {self.peek()[1]!r} in filter expression")
+        return node
+
+    def parse_or(self) -> Node:
+        """Parse a disjunction."""
+        node = self.parse_and()
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self) -> Node:
+        """Parse a conjunction."""
+        node = self.parse_not()
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            node = ("and", node, self.parse_not())
+        return node
+
+    def parse_not(self) -> Node:
+        """Parse a negation."""
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> Node:
+        """Parse a comparison, or a single operand."""
+        node = self.parse_operand()
+        if self.peek()[0] == "op":
+            _, op = self.take()
+            node = ("cmp", op, node, self.parse_operand())
+        return node
+
+    def parse_operand(self) -> Node:
+        """Parse a field, value or parenthesised expression."""
+        kind, value = self.take()
+        if kind == "paren" and value == "(":
+            node = self.parse_or()
+            if self.take() != ("paren", ")"):
+                raise ExpressionError("Missing ) in filter expression")
+            return node
+        if kind == "name":
+            if value not in FIELDS:
+                raise ExpressionError(f"Unknown field {value!r}; expected one of {', '.join(FIELDS)}")
+            return ("field", value)
+        if kind == "number":
+            return ("literal", int(value))
+        if kind == "date":
+            try:
+                return ("literal", parse_date(value))
+            except ValueError:
+                raise ExpressionError(f"Invalid date {value!r} in filter expression")
+        if kind == "keyword" and value in ("true", "false"):
+            return ("literal", value == "true")
+        raise ExpressionError(f"Unexpected {value!r} in filter expression" if value else "Incomplete filter expression")
+
+
+def parse_expression(text: str) -> Node:
+    """Return parsed filter expression.
+
+    :param text:  filter expression
+    """
+    return Parser(text).parse()
+
+
+def build_filter(args: Namespace) -> Optional[Node]:
+    """Return a single expression combining all command-line filters, or None.
+
+    :param args:  command-line argument namespace
+
+    The --start_date, --end_date, --since_id, --is_retweet, --is_reply, term
+    (--text, --hashtag, --mention and --domain) and --regex options are
+    converted to clauses of the expression, and combined with any --filter
+    expression. Tweets match a term option if they contain any of its values.
+    """
+    logger = logging.getLogger(__name__)
+
+    clauses: List[Node] = []
+    start, end = date_bounds(args, "tweets")
+    if start is not None:
+        clauses.append(("cmp", ">=", ("field", "created"), ("literal", start)))
+    if end is not None:
+        clauses.append(("cmp", "<=", ("field", "created"), ("literal", end)))
+
+    if args.since_id is not None:
+        logger.info("Filtering archive for tweets with IDs greater than %s...", args.since_id)
+        clauses.append(("cmp", ">", ("field", "id"), ("literal", args.since_id)))
+
+    if args.is_retweet:
+        logger.info("Filtering archive for tweets that are retweets...")
+        clauses.append(("field", "retweet"))
+
+    if args.is_reply:
+        logger.info("Filtering archive for tweets that are replies...")
+        clauses.append(("field", "reply"))
+
+    for kind in TERM_KINDS:
+        if getattr(args, kind):
+            logger.info("Filtering archive for tweets with %s %s...", kind, ", ".join(getattr(args, kind)))
+            values = tuple(parse_terms(kind, _) for _ in getattr(args, kind))
+            if not all(values):
+                logger.error("Empty %s filter in %s (exiting)", kind, ", ".join(getattr(args, kind)))
+                raise SystemError(1)
+            clauses.append(("terms", kind, values))
+
+    if args.regex:
+        logger.info("Filtering archive for tweets with text matching %s...", args.regex)
+        try:
+            re.compile(args.regex)
+        except re.error:
+            logger.error("Could not compile regular expression %s (exiting)", args.regex, exc_info=True)
+            raise SystemError(1)
+        clauses.append(("regex", args.regex))
+
+    if args.filter:
+        logger.info("Filtering archive for tweets matching %s...", args.filter)
+        try:
+            clauses.append(parse_expression(args.filter))
+        except ExpressionError:
+            logger.error("Could not parse filter expression %s (exiting)", args.filter, exc_info=True)
+            raise SystemError(1)
+
+    node: Optional[Node] = None
+    for clause in clauses:
+        node = clause if node is None else ("and", node, clause)
+    return node
+
+
+def referenced_fields(node: Node) -> List[str]:
+    """Return names of the fields referenced by the passed expression, once for each reference."""
+    if node[0] == "field":
+        return [node[1]]
+    if node[0] == "not":
+        return referenced_fields(node[1])
+    if node[0] in ("and", "or"):
+        return referenced_fields(node[1]) + referenced_fields(node[2])
+    if node[0] == "cmp":
+        return referenced_fields(node[2]) + referenced_fields(node[3])
+    return []
+
+
+def to_source(node: Node, bound: Collection[str] = ()) -> str:
+    """Return Python source for the passed expression, evaluated on a tweet.
+
+    :param node:  parsed filter expression
+    :param bound:  names of fields whose values are bound to local variables of the same name
+    """
+    if node[0] == "field":
+        return node[1] if node[1] in bound else f"_{node[1]}(tweet)"
+    if node[0] == "literal":
+        return repr(node[1])
+    if node[0] == "terms":
+        return f"_has_terms(tweet, {node[1]!r}, {node[2]!r})"
+    if node[0] == "regex":
+        return f"_text_search(tweet, {node[1]!r})"
+    if node[0] == "not":
+        return f"(not {to_source(node[1], bound)})"
+    if node[0] in ("and", "or"):
+        return f"({to_source(node[1], bound)} {node[0]} {to_source(node[2], bound)})"
+    return f"({to_source(node[2], bound)} {SOURCE_OPERATORS.get(node[1], node[1])} {to_source(node[3], bound)})"
+
+
+def compile_predicate(node: Node) -> Callable[[dict], bool]:
+    """Return a single Python function evaluating the passed expression on a tweet.
+
+    :param node:  parsed filter expression
+
+    The expression is compiled once to a single function, so each tweet is
+    tested with one call, short-circuiting on the first failed clause. Fields
+    referenced more than once, such as the creation time compared with both
+    --start_date and --end_date, are extracted once per tweet.
+    """
+    namespace: Dict[str, Callable] = {f"_{name}": extractor for name, (_, extractor) in FIELDS.items()}
+    namespace.update(_has_terms=has_terms, _text_search=text_search)
+    bound = sorted(name for name, count in Counter(referenced_fields(node)).items() if count > 1)
+    body = "".join(f"    {name} = _{name}(tweet)\n" for name in bound)
+    body += f"    return bool({to_source(node, bound)})\n"
+    exec(compile(f"def predicate(tweet):\n{body}", "<filter>", "exec"), namespace)
+    return namespace["predicate"]
+
+
+def compile_mask(node: Node) -> Callable:
+    """Return function evaluating the passed expression as a mask over a TweetTable.
+
+    :param node:  parsed filter expression
+    """
+
+    def evaluate(table, node: Node):
+        if node[0] == "field":
+            return table[FIELDS[node[1]][0]]
+        if node[0] == "literal":
+            return node[1]
+        if node[0] == "terms":
+            return table.match(node[1], node[2])
+        if node[0] == "regex":
+            return table.search(node[1])
+        if node[0] == "cmp":
+            return OPERATORS[node[1]](evaluate(table, node[2]), evaluate(table, node[3]))
+        if node[0] == "not":
+            return ~as_mask(table, evaluate(table, node[1]))
+        if node[0] == "and":
+            return as_mask(table, evaluate(table, node[1])) & as_mask(table, evaluate(table, node[2]))
+        return as_mask(table, evaluate(table, node[1])) | as_mask(table, evaluate(table, node[2]))
+
+    def as_mask(table, value):
+        if getattr(value, "shape", ()) == ():
+            return table.constant(bool(value))
+        return value.astype(bool)
+
+    return lambda table: as_mask(table, evaluate(table, node))
@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for the Twitter API, for testing and load-testing without Twitter.
+
+FakeTwitter is a requests transport adapter, mounted on the HTTP session of
+a real tweepy.API, which serves the Twitter API endpoints used by
+lptwitdelete in-process. tweepy's own request, response-parsing and error
+handling therefore run as they would against Twitter. The fake serves a
+synthetic user timeline, and accepts deletions of tweets and DMs, and the
+undoing of likes and retweets, after a configurable latency. Requests fail
+at a configurable rate with the errors Twitter returns, and each endpoint
+enforces its own rate-limit quota, reported in rate-limit headers, so that
+the retries and backoff of a whole run are exercised offline.
+"""
+
+import bisect
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, cast
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from lptwitdelete.archive import iter_archive
+from lptwitdelete.twitter import TIMELINE_LIMIT, oauth_login, pooled_session
+
+# Settings accepted by FakeTwitter.from_settings(), and their types
+SETTINGS = {
+    "latency": float,
+    "error_rate": float,
+    "gone_rate": float,
+    "rate_limit": int,
+    "window": float,
+    "tweets": int,
+    "seed": int,
+    "archive": Path,
+}
+
+# Proportions of synthetic timeline statuses that are retweets and replies
+RETWEET_FRACTION = 0.3
+REPLY_FRACTION = 0.2
+
+# Synthetic statuses are spread over this period, ending at LATEST, with IDs
+# increasing from FIRST_STATUS_ID
+LATEST = datetime(2022, 1, 1, tzinfo=timezone.utc)
+SPAN = timedelta(days=365 * 12)
+FIRST_STATUS_ID = 100000000000000000
+
+# Host serving the Twitter API, and the credentials with which tweepy signs
+# requests to the fake
+API_HOST = "api.twitter.com"
+CREDENTIALS = ("fake_consumer_key", "fake_consumer_secret", "fake_access_token", "fake_access_token_secret")
+
+# Endpoints, as (resource family, endpoint) in rate_limit_status responses
+VERIFY_CREDENTIALS = ("account", "/account/verify_credentials")
+RATE_LIMIT_STATUS = ("application", "/application/rate_limit_status")
+TIMELINE = ("statuses", "/statuses/user_timeline")
+LOOKUP = ("statuses", "/statuses/lookup")
+DESTROY_STATUS = ("statuses", "/statuses/destroy/:id")
+DESTROY_DM = ("direct_messages", "/direct_messages/events/destroy")
+DESTROY_FAVORITE = ("favorites", "/favorites/destroy")
+UNRETWEET = ("statuses", "/statuses/unretweet/:id")
+
+# Endpoints subject to latency, quotas and injected errors, those whose quotas are
+# reported by rate_limit_status (which, as on Twitter, lists only GET endpoints), and
+# those that delete a status or DM, or undo a like or retweet
+LIMITED = (TIMELINE, LOOKUP, DESTROY_STATUS, DESTROY_DM, DESTROY_FAVORITE, UNRETWEET)
+REPORTED = (TIMELINE, LOOKUP)
+DELETIONS = (DESTROY_STATUS, DESTROY_DM)
+UNDOS = (DESTROY_FAVORITE, UNRETWEET)
+
+# Requests served, as (HTTP method, URL path, endpoint); IDs in the path are
+# captured as "id"
+ROUTES = [
+    (method, re.compile(r"/1\.1" + path + r"\.json"), endpoint)
+    for method, path, endpoint in (
+        ("GET", r"/account/verify_credentials", VERIFY_CREDENTIALS),
+        ("GET", r"/application/rate_limit_status", RATE_LIMIT_STATUS),
+        ("GET", r"/statuses/user_timeline", TIMELINE),
+        ("GET", r"/statuses/lookup", LOOKUP),
+        ("POST", r"/statuses/destroy/(?P<id>\d+)", DESTROY_STATUS),
+        ("DELETE", r"/direct_messages/events/destroy", DESTROY_DM),
+        ("POST", r"/favorites/destroy", DESTROY_FAVORITE),
+        ("POST", r"/statuses/unretweet/(?P<id>\d+)", UNRETWEET),
+    )
+]
+
+# Twitter API error codes for missing statuses and DMs
+NO_STATUS_FOUND = 144
+PAGE_DOES_NOT_EXIST = 34
+
+# HTTP status, reason and Twitter API error for each failed outcome of a request
+ERRORS = {
+    "rate_limited": (429, "Too Many Requests", 88, "Rate limit exceeded"),
+    "server_error": (503, "Service Unavailable", 130, "Over capacity"),
+    "gone": (404, "Not Found", NO_STATUS_FOUND, "No status found with that ID."),
+    "unknown": (404, "Not Found", PAGE_DOES_NOT_EXIST, "Sorry, that page does not exist."),
+}
+
+
+def make_response(
+    request: requests.PreparedRequest, status_code: int, reason: str, headers: Dict[str, str], body: Any = None
+) -> requests.Response:
+    """Return HTTP response to the passed request, with a JSON body.
+
+    :param request:  request being answered
+    :param status_code:  HTTP status code
+    :param reason:  HTTP reason phrase
+    :param headers:  HTTP response headers
+    :param body:  JSON-serialisable response body (None for no content)
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = reason
+    response.headers = CaseInsensitiveDict(headers)
+    if body is not None:
+        response.headers["content-type"] = "application/json;charset=utf-8"
+        response._content = json.dumps(body).encode("utf-8")
+    else:
+        response._content = b""
+    response.encoding = "utf-8"
+    response.url = cast(str, request.url)
+    response.request = request
+    return response
+
+
+def make_status(rng: random.Random, idx: int, count: int) -> dict:
+    """Return JSON dict for a synthetic timeline status.
+
+    :param rng:  random number generator
+    :param idx:  index of the status; later indices are newer statuses
+    :param count:  total number of statuses
+    """
+    created = LATEST - SPAN * (count - idx) / max(count, 1)
+    status_id = FIRST_STATUS_ID + idx * 1000 + rng.randrange(1000)
+    status = {
+        "id": status_id,
+        "id_str": str(status_id),
+        "created_at": created.strftime("%a %b %d %H:%M:%S %z %Y"),
+        "full_text": "synthetic status %d" % idx,
+        "in_reply_to_screen_name": None,
+        "favorite_count": rng.randrange(20),
+        "retweet_count": rng.randrange(10),
+    }
+    roll = rng.random()
+    if roll < RETWEET_FRACTION:
+        status["full_text"] = "RT @user%d: %s" % (rng.randrange(200), status["full_text"])
+    elif roll < RETWEET_FRACTION + REPLY_FRACTION:
+        status["in_reply_to_screen_name"] = "user%d" % rng.randrange(200)
+    return status
+
+
+def archive_statuses(archpath: Path) -> List[dict]:
+    """Return JSON dicts for timeline statuses from the tweets in an archive file.
+
+    :param archpath:  path to tweet archive file
+    """
+    statuses = []
+    for record in iter_archive(archpath):
+        if "tweet" in record:
+            statuses.append({**record["tweet"], "id": int(record["tweet"]["id_str"])})
+    return statuses
+
+
+class FakeTwitter(BaseAdapter):
+
+    """In-process Twitter API with configurable latency, error rates and rate limits.
+
+    Each request to a timeline, lookup or deletion endpoint waits for the
+    configured latency, then counts against its endpoint's quota. Requests
+    beyond the quota fail with HTTP 429 until the rate-limit window resets;
+    otherwise a proportion of deletions fail with HTTP 503 (timeline
+    requests, which are not retried, never fail this way).
+
+    The timeline holds synthetic statuses, or the tweets in an archive file.
+    As on Twitter, only its most recent TIMELINE_LIMIT statuses are served,
+    and each page holds those of the requested number of statuses that have
+    not been deleted, so pages may be short. Tweets and DMs that are not in
+    the timeline exist too, so that records filtered from any archive can be
+    "deleted". A proportion, gone_rate, of all IDs were "already deleted",
+    chosen by hashing each ID so that lookups and deletions agree: these, and
+    records deleted by earlier requests, are missing from the timeline and
+    from lookups, and their deletion fails with HTTP 404. Likes and retweets
+    of any tweet that exists can be undone, once. Counts of requests by
+    endpoint and outcome are kept in stats.
+    """
+
+    def __init__(
+        self,
+        screen_name: str = "fake_user",
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        gone_rate: float = 0.0,
+        rate_limit: Optional[int] = None,
+        window: float = 15 * 60,
+        tweets: int = 1000,
+        seed: int = 0,
+        archive: Optional[Path] = None,
+    ) -> None:
+        """Create fake Twitter API.
+
+        :param screen_name:  screen name of the authenticated user
+        :param latency:  time taken by each request (seconds)
+        :param error_rate:  proportion of deletions failing with a server error
+        :param gone_rate:  proportion of tweets and DMs that were already deleted
+        :param rate_limit:  requests allowed to each endpoint per window (None for no limit)
+        :param window:  length of rate-limit windows (seconds)
+        :param tweets:  number of statuses in the synthetic timeline
+        :param seed:  seed for the synthetic timeline, injected errors and deleted records
+        :param archive:  tweet archive file whose tweets form the timeline, in place of synthetic statuses
+        """
+        super().__init__()
+        self.screen_name = screen_name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.gone_rate = gone_rate
+        self.rate_limit = rate_limit
+        self.window = window
+        self.stats: Dict[str, int] = {}
+
+        self.seed = seed
+        self._rng = random.Random(seed)
+        if archive is None:
+            statuses = [make_status(self._rng, idx, tweets) for idx in range(tweets)]
+        else:
+            statuses = archive_statuses(archive)
+        self._statuses: Dict[int, dict] = {_["id"]: _ for _ in statuses}
+        self._ids: List[int] = sorted(self._statuses)
+        self._deleted: set = {_ for _ in self._ids if self._already_deleted(_)}
+        self._undone: set = set()  # (endpoint, tweet ID) of undone likes and retweets
+        self._quotas: Dict[tuple, List[float]] = {}  # endpoint: [remaining, reset]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: str, screen_name: str = "fake_user") -> "FakeTwitter":
+        """Return fake Twitter API configured by a comma-separated string of settings.
+
+        :param settings:  e.g. "latency=0.1,error_rate=0.05,rate_limit=300,window=60"
+        :param screen_name:  screen name of the authenticated user
+        """
+        logger = logging.getLogger(__name__)
+
+        kwargs = {}
+        for setting in filter(None, (_.strip() for _ in settings.split(","))):
+            name, _, value = setting.partition("=")
+            if name not in SETTINGS:
+                logger.error("Unknown fake API setting %s; use %s (exiting)", name, ", ".join(SETTINGS))
+                raise SystemError(1)
+            try:
+                kwargs[name] = SETTINGS[name](value)
+            except ValueError:
+                logger.error("Invalid value for fake API setting %s: %s (exiting)", name, value)
+                raise SystemError(1)
+        return cls(screen_name=screen_name, **kwargs)
+
+    def login(self, session: Optional[requests.Session] = None):
+        """Return tweepy API, authenticated with placeholder credentials, whose requests are served by this fake.
+
+        :param session:  HTTP session on which to mount the fake (default: a new pooled session)
+        """
+        session = session if session is not None else pooled_session(1)
+        session.mount(f"https://{API_HOST}/", self)
+        return oauth_login(*CREDENTIALS, session=session)
+
+    def send(self, request: requests.PreparedRequest, *args, **kwargs) -> requests.Response:
+        """Serve a request to the Twitter API.
+
+        :param request:  prepared HTTP request
+        """
+        # Prepared requests hold their URL as a native string
+        url = urlsplit(cast(str, request.url))
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        for method, pattern, endpoint in ROUTES:
+            match = pattern.fullmatch(url.path)
+            if match is not None and method == request.method:
+                params.update(match.groupdict())
+                break
+        else:
+            return self._error(request, "unknown", {})
+
+        if endpoint not in LIMITED:
+            return make_response(request, 200, "OK", {}, self._serve(endpoint, params))
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            outcome = "ok" if self._available(endpoint, params) else "gone"
+            headers = {}
+            if self.rate_limit is not None:
+                now = time.time()
+                quota = self._quotas.get(endpoint)
+                if quota is None or now >= quota[1]:
+                    quota = self._quotas[endpoint] = [self.rate_limit, now + self.window]
+                if quota[0] > 0:
+                    quota[0] -= 1
+                else:
+                    outcome = "rate_limited"
+                headers = {
+                    "x-rate-limit-limit": str(self.rate_limit),
+                    "x-rate-limit-remaining": str(int(quota[0])),
+                    "x-rate-limit-reset": str(int(quota[1])),
+                }
+            if endpoint != TIMELINE and outcome != "rate_limited" and self._rng.random() < self.error_rate:
+                outcome = "server_error"
+            key = "%s %s" % (endpoint[1], outcome)
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+            if outcome != "ok":
+                return self._error(request, outcome, headers, endpoint)
+            body = self._serve(endpoint, params)
+        return make_response(request, 200, "OK", headers, body)
+
+    def close(self) -> None:
+        """Release resources when the session is released; the fake holds none."""
+
+    def _error(
+        self, request: requests.PreparedRequest, outcome: str, headers: Dict[str, str], endpoint: Tuple = ()
+    ) -> requests.Response:
+        """Return response for a failed request, with the Twitter API's error body."""
+        status_code, reason, code, message = ERRORS[outcome]
+        if outcome == "gone" and endpoint == DESTROY_DM:
+            code, message = ERRORS["unknown"][2:]
+        return make_response(request, status_code, reason, headers, {"errors": [{"code": code, "message": message}]})
+
+    def _already_deleted(self, record_id: int) -> bool:
+        """Return True if the passed ID is one of the proportion gone_rate deleted before the run."""
+        return self.gone_rate > 0 and random.Random("%d:%d" % (self.seed, record_id)).random() < self.gone_rate
+
+    def _exists(self, record_id: int) -> bool:
+        """Return True if the status or DM with the passed ID exists."""
+        if record_id in self._deleted:
+            return False
+        return record_id in self._statuses or not self._already_deleted(record_id)
+
+    def _available(self, endpoint: tuple, params: Dict[str, str]) -> bool:
+        """Return False if a request would delete or undo a record that does not exist, or was already undone."""
+        if endpoint in DELETIONS:
+            return self._exists(int(params["id"]))
+        if endpoint in UNDOS:
+            return (endpoint, int(params["id"])) not in self._undone and self._exists(int(params["id"]))
+        return True
+
+    def _status(self, status_id: int) -> dict:
+        """Return JSON dict for the status with the passed ID."""
+        return self._statuses.get(status_id, {"id": status_id, "id_str": str(status_id)})
+
+    def _serve(self, endpoint: tuple, params: Dict[str, str]) -> Any:
+        """Carry out a successful request, and return the JSON response body.
+
+        :param endpoint:  (resource family, endpoint) requested
+        :param params:  request parameters, including any ID in the request path
+        """
+        if endpoint == VERIFY_CREDENTIALS:
+            return {"id": 1, "id_str": "1", "screen_name": self.screen_name}
+        if endpoint == RATE_LIMIT_STATUS:
+            return {"resources": self._resources()}
+        if endpoint == TIMELINE:
+            return self._timeline(int(params.get("count", 20)), params.get("max_id"), params.get("since_id"))
+        if endpoint == LOOKUP:
+            ids = [int(_) for _ in params["id"].split(",") if _]
+            return [self._status(_) for _ in ids if self._exists(_)]
+        record_id = int(params["id"])
+        if endpoint in UNDOS:
+            self._undone.add((endpoint, record_id))
+            return self._status(record_id)
+        self._deleted.add(record_id)
+        return None if endpoint == DESTROY_DM else self._status(record_id)
+
+    def _resources(self) -> Dict[str, Dict]:
+        """Return the current quota of each reported endpoint, in the format of the API's rate-limit status."""
+        resources: Dict[str, Dict] = {}
+        if self.rate_limit is not None:
+            now = time.time()
+            with self._lock:
+                for endpoint in REPORTED:
+                    remaining, reset = self._quotas.get(endpoint, [self.rate_limit, now + self.window])
+                    if now >= reset:
+                        remaining, reset = self.rate_limit, now + self.window
+                    resources.setdefault(endpoint[0], {})[endpoint[1]] = {
+                        "limit": self.rate_limit,
+                        "remaining": int(remaining),
+                        "reset": int(reset),
+                    }
+        return resources
+
+    def _timeline(self, count: int, max_id: Optional[str], since_id: Optional[str]) -> List[dict]:
+        """Return a page of undeleted statuses from the timeline, newest first.
+
+        :param count:  number of statuses requested, including any that have been deleted
+        :param max_id:  only return statuses with IDs up to this (or None)
+        :param since_id:  only return statuses with IDs greater than this (or None)
+        """
+        idx = len(self._ids) if max_id is None else bisect.bisect_right(self._ids, int(max_id))
+        stop = max(idx - count, len(self._ids) - TIMELINE_LIMIT, 0)
+        if since_id is not None:
+            stop = max(stop, bisect.bisect_right(self._ids, int(since_id)))
+        return [self._statuses[_] for _ in reversed(self._ids[stop:idx]) if _ not in self._deleted]
@@ -2,10 +2,97 @@
 """Apply filters to collections of tweets."""
 
 import logging
+import re
 
 from argparse import Namespace
-from datetime import datetime
-from typing import Iterable, List
+from calendar import timegm
+from datetime import datetime, timezone
+from typing import FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+# Month abbreviations used in tweet creation times
+MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+
+# Kinds of term by which tweets can be selected: words of the tweet text, and the
+# hashtags, mentioned screen names and linked URL domains in its entities
+TERM_KINDS = ("text", "hashtag", "mention", "domain")
+
+# Command-line filters that can be applied to each kind of content; dates apply to
+# all content. A filter that cannot be applied is an error rather than being
+# ignored, as ignoring it would select more records for deletion than were asked for
+CONTENT_FILTERS = {
+    "tweets": ("filter", "is_retweet", "is_reply", "since_id", "text", "hashtag", "mention", "domain", "regex"),
+    "dms": ("conversation", "sender", "since_id"),
+    "likes": ("text", "regex"),
+}
+
+# Words in tweet text, after removing links
+WORD_RE = re.compile(r"\w+")
+LINK_RE = re.compile(r"https?://\S+")
+
+
+def check_filters(args: Namespace, content: str) -> None:
+    """Exit if any filter was given that cannot be applied to the passed kind of content.
+
+    :param args:  command-line argument namespace
+    :param content:  kind of content being filtered (a key of CONTENT_FILTERS)
+    """
+    logger = logging.getLogger(__name__)
+
+    names = {_ for filters in CONTENT_FILTERS.values() for _ in filters}
+    unsupported = sorted(_ for _ in names - set(CONTENT_FILTERS[content]) if getattr(args, _, None))
+    if unsupported:
+        logger.error(
+            "Filters %s cannot be applied to %s (exiting)", ", ".join(f"--{_}" for _ in unsupported), content
+        )
+        raise SystemError(1)
+
+
+def iter_filter_dms(conversations: Iterable, args: Namespace) -> Iterator[dict]:
+    """Apply filters to DM conversations and return iterator over filtered messages.
+
+    :param conversations:  iterable of JSON format DM conversations
+    :param args:  command-line argument namespace
+
+    Conversations are flattened into a DMIndex, and messages are selected
+    from it by conversation, sender, date and ID.
+    """
+    # Imported here as the index builds on these filters
+    from lptwitdelete.dmindex import DMIndex
+
+    logger = logging.getLogger(__name__)
+
+    logger.info("Filtering DM conversations...")
+    check_filters(args, "dms")
+    start, end = date_bounds(args, "DMs")
+    if args.conversation:
+        logger.info("Filtering archive for DMs in conversations %s...", ", ".join(args.conversation))
+    if args.sender:
+        logger.info("Filtering archive for DMs sent by %s...", ", ".join(args.sender))
+    if args.since_id is not None:
+        logger.info("Filtering archive for DMs with IDs greater than %s...", args.since_id)
+
+    index = DMIndex.from_conversations(conversations)
+    logger.info("Identified %s messages in %s conversations", len(index), len(index.conversation_ids))
+
+    if start is not None or end is not None:
+        for row in index.undated():
+            logger.warning("Message %s has no time created field", index.messages[row])
+    rows = index.select(start, end, args.conversation, args.sender, args.since_id)
+    return iter(index.records(rows))
 
 
 def filter_dms(conversations: Iterable, args: Namespace) -> List[dict]:
@@ -14,46 +101,80 @@ def filter_dms(conversations: Iterable, args: Namespace) -> List[dict]:
     :param conversations:  iterable of JSON format DM conversations
     :param args:  command-line argument namespace
     """
+    return list(iter_filter_dms(conversations, args))
+
+
+def iter_filter_likes(likes: Iterable, args: Namespace) -> Iterator[dict]:
+    """Apply filters to likes and return iterator over filtered likes, without duplicates.
+
+    :param likes:  iterable of JSON format likes
+    :param args:  command-line argument namespace
+
+    Likes hold only the ID and text of the liked tweet, so only --text and
+    --regex apply to them. Like DMs with no creation time, likes never
+    match a date.
+    """
     logger = logging.getLogger(__name__)
 
-    # Process messages in each conversation
-    logger.info("Filtering DM conversations...")
-    messages = []
-    for conversation in conversations:
-        for message in conversation["dmConversation"]["messages"]:
-            messages.append(message)
-    logger.info(
-        "Identified %s messages in %s conversations", len(messages), len(conversations)
-    )
-
-    # Filter start date for deletion
-    if args.start_date:
-        logger.info("Filtering archive for DMs posted after %s...", args.start_date)
+    logger.info("Filtering likes...")
+    check_filters(args, "likes")
+    start, end = date_bounds(args, "likes")
+    if start is not None or end is not None:
+        logger.warning("Likes have no creation times, so no likes are selected with --start_date or --end_date")
+        return iter([])
+    values = tuple(parse_terms("text", _) for _ in args.text or [])
+    if not all(values):
+        logger.error("Empty text filter in %s (exiting)", ", ".join(args.text))
+        raise SystemError(1)
+    if args.regex:
         try:
-            sdate = datetime.strptime(args.start_date, "%Y-%m-%d").astimezone()
-        except ValueError:
-            logger.error(
-                "Could not parse start date %s (exiting)",
-                args.start_date,
-                exc_info=True,
-            )
+            re.compile(args.regex)
+        except re.error:
+            logger.error("Could not compile regular expression %s (exiting)", args.regex, exc_info=True)
             raise SystemError(1)
-        messages = list(filter(lambda message: date_after(message, sdate), messages))
-        logger.info("Identified %s messages after start date", len(messages))
 
-    # Filter end date for deletion
-    if args.end_date:
-        logger.info("Filtering archive for DMs posted before %s...", args.end_date)
-        try:
-            edate = datetime.strptime(args.end_date, "%Y-%m-%d").astimezone()
-        except ValueError:
-            logger.error(
-                "Could not parse end date %s (exiting)", args.end_date, exc_info=True
-            )
-            raise SystemError(1)
-        messages = filter(lambda message: date_before(message, edate), messages)
+    def select():
+        seen = set()
+        for like in likes:
+            tweet = {"tweet": {"full_text": like["like"].get("fullText") or ""}}
+            if values and not has_terms(tweet, "text", values):
+                continue
+            if args.regex and not text_search(tweet, args.regex):
+                continue
+            if like["like"]["tweetId"] not in seen:
+                seen.add(like["like"]["tweetId"])
+                yield like
+
+    return select()
 
-    return list(messages)
+
+def iter_filter_tweets(tweets: Iterable, args: Namespace) -> Iterator[dict]:
+    """Apply filters to tweets and return iterator over filtered tweets.
+
+    :param tweets:  iterable of JSON format tweets
+    :param args:  command-line argument namespace
+
+    Tweets are filtered lazily as the iterator is consumed, except for
+    columnar filtering, which needs the whole collection.
+    """
+    check_filters(args, "tweets")
+
+    # Apply all filters as vectorized masks over a columnar table, if requested;
+    # imported here so that numpy is only loaded when it is used
+    if args.columnar:
+        from lptwitdelete.table import filter_tweets_columnar
+
+        return iter(filter_tweets_columnar(tweets, args))
+
+    # Combine all filters into a single compiled predicate, so each tweet is tested
+    # in one pass; imported here as the expression module builds on these filters
+    from lptwitdelete.expression import build_filter, compile_predicate
+
+    node = build_filter(args)
+    if node is not None:
+        tweets = filter(compile_predicate(node), tweets)
+
+    return iter(tweets)
 
 
 def filter_tweets(tweets: Iterable, args: Namespace) -> List[dict]:
@@ -62,77 +183,143 @@ def filter_tweets(tweets: Iterable, args: Namespace) -> List[dict]:
     :param tweets:  iterable of JSON format tweets
     :param args:  command-line argument namespace
     """
+    return list(iter_filter_tweets(tweets, args))
+
+
+def parse_date(date: str) -> int:
+    """Return UNIX time of local midnight at the start of a YYYY-MM-DD date.
+
+    :param date:  date in YYYY-MM-DD format
+    """
+    return int(datetime.strptime(date, "%Y-%m-%d").astimezone().timestamp())
+
+
+def date_bounds(args: Namespace, label: str) -> Tuple[Optional[int], Optional[int]]:
+    """Return (start, end) UNIX times from the command-line start and end dates.
+
+    :param args:  command-line argument namespace
+    :param label:  description of the records being filtered, for logging
+
+    Either bound is None if the corresponding date was not given.
+    """
     logger = logging.getLogger(__name__)
 
-    # Filter start date for deletion
-    if args.start_date:
-        logger.info("Filtering archive for tweets posted after %s...", args.start_date)
+    bounds = []
+    for date, position, name in (
+        (args.start_date, "after", "start"),
+        (args.end_date, "before", "end"),
+    ):
+        if not date:
+            bounds.append(None)
+            continue
+        logger.info("Filtering archive for %s posted %s %s...", label, position, date)
         try:
-            sdate = datetime.strptime(args.start_date, "%Y-%m-%d").astimezone()
+            bounds.append(parse_date(date))
         except ValueError:
-            logger.error(
-                "Could not parse start date %s (exiting)",
-                args.start_date,
-                exc_info=True,
-            )
+            logger.error("Could not parse %s date %s (exiting)", name, date, exc_info=True)
             raise SystemError(1)
-        tweets = filter(lambda tweet: date_after(tweet, sdate), tweets)
+    return bounds[0], bounds[1]
 
-    # Filter end date for deletion
-    if args.end_date:
-        logger.info("Filtering archive for tweets posted before %s...", args.end_date)
-        try:
-            edate = datetime.strptime(args.end_date, "%Y-%m-%d").astimezone()
-        except ValueError:
-            logger.error(
-                "Could not parse end date %s (exiting)", args.end_date, exc_info=True
+
+def parse_created_at(created_at: str) -> int:
+    """Return UNIX time for a tweet creation time.
+
+    :param created_at:  time in "%a %b %d %X %z %Y" format
+
+    e.g. Mon Jul 02 00:00:00 +0000 2019
+
+    The format has fixed field widths, so fields are sliced out directly,
+    which is much faster than datetime.strptime(); anything unexpected falls
+    back to strptime().
+    """
+    try:
+        offset = int(created_at[21:23]) * 3600 + int(created_at[23:25]) * 60
+        if created_at[20] == "-":
+            offset = -offset
+        elif created_at[20] != "+":
+            raise ValueError
+        return (
+            timegm(
+                (
+                    int(created_at[26:]),
+                    MONTHS[created_at[4:7]],
+                    int(created_at[8:10]),
+                    int(created_at[11:13]),
+                    int(created_at[14:16]),
+                    int(created_at[17:19]),
+                )
             )
-            raise SystemError(1)
-        tweets = filter(lambda tweet: date_before(tweet, edate), tweets)
+            - offset
+        )
+    except (IndexError, KeyError, ValueError):
+        return int(datetime.strptime(created_at, "%a %b %d %X %z %Y").timestamp())
 
-    # Filter if retweet
-    if args.is_retweet:
-        logger.info("Filtering archive for tweets that are retweets...")
-        tweets = filter(is_retweet, tweets)
 
-    # Filter if retweet
-    if args.is_reply:
-        logger.info("Filtering archive for tweets that are replies...")
-        tweets = filter(is_reply, tweets)
+def parse_created_at_iso(created_at: str) -> int:
+    """Return UNIX time for a DM creation time.
 
-    return list(tweets)
+    :param created_at:  UTC time in ISO format, e.g. 2019-07-02T00:00:00.000Z
+    """
+    try:
+        return timegm(
+            (
+                int(created_at[0:4]),
+                int(created_at[5:7]),
+                int(created_at[8:10]),
+                int(created_at[11:13]),
+                int(created_at[14:16]),
+                int(created_at[17:19]),
+            )
+        )
+    except ValueError:
+        return int(
+            datetime.fromisoformat(created_at.rstrip("Z"))
+            .replace(tzinfo=timezone.utc)
+            .timestamp()
+        )
 
 
-def date_after(tweet: dict, date: datetime):
-    """Return True if passed tweet was posted after the passed date.
+def record_timestamp(tweet: dict) -> Optional[int]:
+    """Return UNIX time at which the passed tweet or DM was created, or None.
+
+    :param tweet:  JSON dict for tweet, DM or retweet
+    """
+    if "tweet" in tweet:
+        return parse_created_at(tweet["tweet"]["created_at"])
+    elif "retweet" in tweet:
+        return parse_created_at(tweet["retweet"]["created_at"])
+    elif "messageCreate" in tweet:
+        return parse_created_at_iso(tweet["messageCreate"]["createdAt"])
+    elif "welcomeMessageCreate" in tweet:
+        return parse_created_at_iso(tweet["welcomeMessageCreate"]["createdAt"])
+    return None
+
+
+def date_in_range(tweet: dict, start: Optional[int], end: Optional[int]) -> bool:
+    """Return True if the passed tweet was posted between the passed times.
 
     :param tweet:  JSON dict for tweet
-    :param date:  if the tweet was posted after this date it should be considered for deletion
+    :param start:  UNIX time on or after which the tweet must be posted (or None)
+    :param end:  UNIX time on or before which the tweet must be posted (or None)
+
+    The creation time is parsed once per tweet, and compared to both bounds.
     """
     logger = logging.getLogger(__name__)
 
-    if "tweet" in tweet:
-        tweet_date = datetime.strptime(
-            tweet["tweet"]["created_at"], "%a %b %d %X %z %Y"
-        )
-    elif "messageCreate" in tweet or "welcomeMessageCreate" in tweet:
-        try:
-            tweet_date = datetime.fromisoformat(
-                tweet["messageCreate"]["createdAt"][:-1]
-            )
-        except KeyError:
-            tweet_date = datetime.fromisoformat(
-                tweet["welcomeMessageCreate"]["createdAt"][:-1]
-            )
-        # Can't compare naive to aware objects, so strip the timezone from
-        # comparator date first.
-        date = date.replace(tzinfo=None)
-    else:
+    timestamp = record_timestamp(tweet)
+    if timestamp is None:
         logger.warning("Tweet %s has no time created field", tweet)
         return False
-    if tweet_date >= date:
-        return True
-    return False
+    return (start is None or timestamp >= start) and (end is None or timestamp <= end)
+
+
+def date_after(tweet: dict, date: datetime):
+    """Return True if passed tweet was posted after the passed date.
+
+    :param tweet:  JSON dict for tweet
+    :param date:  if the tweet was posted after this date it should be considered for deletion
+    """
+    return date_in_range(tweet, int(date.timestamp()), None)
 
 
 def date_before(tweet: dict, date: datetime):
@@ -140,35 +327,8 @@ def date_before(tweet: dict, date: datetime):
 
     :param tweet:  JSON dict for tweet
     :param date:  if the tweet was posted before this date it should be considered for deletion
-
-    Expected date format: "%a %b %d %X %z %Y"
-
-    e.g. Mon Jul 02 00:00:00 +0000 2019
     """
-    logger = logging.getLogger(__name__)
-
-    if "tweet" in tweet:
-        tweet_date = datetime.strptime(
-            tweet["tweet"]["created_at"], "%a %b %d %X %z %Y"
-        )
-    elif "messageCreate" in tweet or "welcomeMessageCreate" in tweet:
-        try:
-            tweet_date = datetime.fromisoformat(
-                tweet["messageCreate"]["createdAt"][:-1]
-            )
-        except KeyError:
-            tweet_date = datetime.fromisoformat(
-                tweet["welcomeMessageCreate"]["createdAt"][:-1]
-            )
-        # Can't compare naive to aware objects, so strip the timezone from
-        # comparator date first.
-        date = date.replace(tzinfo=None)
-    else:
-        logger.warning("Tweet %s has no time created field", tweet)
-        return False
-    if tweet_date <= date:
-        return True
-    return False
+    return date_in_range(tweet, None, int(date.timestamp()))
 
 
 def is_retweet(tweet: dict):
@@ -190,6 +350,90 @@ def is_reply(tweet: dict):
 
     :param tweet:  JSON dict for tweet
     """
-    if tweet["tweet"]["in_reply_to_screen_name"]:
+    if tweet["tweet"].get("in_reply_to_screen_name"):
         return True
     return False
+
+
+def tweet_text(tweet: dict) -> str:
+    """Return the text of the passed tweet.
+
+    :param tweet:  JSON dict for tweet
+    """
+    try:
+        return tweet["tweet"]["full_text"]
+    except KeyError:
+        return tweet["tweet"].get("text", "")
+
+
+def url_domains(url: str) -> Set[str]:
+    """Return the domain of the passed URL, and each parent domain below the top level.
+
+    e.g. https://www.gist.github.com/x gives {"gist.github.com", "github.com"}
+    """
+    host = (urlsplit(url).hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    labels = host.split(".")
+    return {".".join(labels[_:]) for _ in range(len(labels) - 1)}
+
+
+def tweet_terms(tweet: dict, kind: str) -> Set[str]:
+    """Return the normalised terms of the passed kind in a tweet.
+
+    :param tweet:  JSON dict for tweet
+    :param kind:  kind of term, from TERM_KINDS
+
+    Terms are lower case; hashtags and mentions are taken from the tweet's
+    entities, without their # and @.
+    """
+    if kind == "text":
+        return set(WORD_RE.findall(LINK_RE.sub(" ", tweet_text(tweet)).lower()))
+    entities = tweet["tweet"].get("entities") or {}
+    if kind == "hashtag":
+        return {_["text"].lower() for _ in entities.get("hashtags", [])}
+    if kind == "mention":
+        return {_["screen_name"].lower() for _ in entities.get("user_mentions", [])}
+    return {
+        domain
+        for url in entities.get("urls", [])
+        for domain in url_domains(url.get("expanded_url") or url.get("url") or "")
+    }
+
+
+def parse_terms(kind: str, value: str) -> FrozenSet[str]:
+    """Return the normalised terms that a tweet must contain to match a command-line term filter.
+
+    :param kind:  kind of term, from TERM_KINDS
+    :param value:  value given on the command line, e.g. a word, #hashtag, @user or domain
+
+    Text values may hold several words, all of which must be in the tweet.
+    """
+    value = value.strip().lower()
+    if kind == "text":
+        return frozenset(WORD_RE.findall(value))
+    if kind == "domain":
+        value = value[4:] if value.startswith("www.") else value
+        return frozenset([value]) if value else frozenset()
+    value = value.lstrip("#@")
+    return frozenset([value]) if value else frozenset()
+
+
+def has_terms(tweet: dict, kind: str, values: Tuple[FrozenSet[str], ...]) -> bool:
+    """Return True if the passed tweet contains all the terms of any of the passed values.
+
+    :param tweet:  JSON dict for tweet
+    :param kind:  kind of term, from TERM_KINDS
+    :param values:  sets of terms returned by parse_terms()
+    """
+    terms = tweet_terms(tweet, kind)
+    return any(_ <= terms for _ in values)
+
+
+def text_search(tweet: dict, pattern: str) -> bool:
+    """Return True if the passed regular expression matches anywhere in the tweet's text.
+
+    :param tweet:  JSON dict for tweet
+    :param pattern:  regular expression
+    """
+    return re.search(pattern, tweet_text(tweet)) is not None
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Append-only journal of deleted tweet and DM IDs, for resuming interrupted runs."""
+
+import logging
+import os
+
+from pathlib import Path
+from typing import Set
+
+# Number of IDs written to the journal between calls to fsync
+SYNC_INTERVAL = 100
+
+
+class DeletionJournal:
+
+    """Append-only log of IDs that have been deleted, one per line.
+
+    IDs already in the journal are loaded into a set when it is opened, so
+    membership checks are O(1). New IDs are appended as they are deleted and
+    flushed to disk in batches of SYNC_INTERVAL; a partial final line left by
+    an interrupted run is ignored.
+    """
+
+    def __init__(self, path: Path, sync_interval: int = SYNC_INTERVAL) -> None:
+        """Open the journal at the passed path, creating it if necessary.
+
+        :param path:  path to journal file
+        :param sync_interval:  number of IDs written between calls to fsync
+        """
+        logger = logging.getLogger(__name__)
+
+        self.path = path
+        self.sync_interval = sync_interval
+        self.ids: Set[str] = set()
+        self._unsynced = 0
+
+        if path.is_file():
+            with path.open("r", encoding="utf-8") as ifh:
+                lines = ifh.read().split("\n")
+            # The last element is either empty, or a partially-written ID
+            self.ids.update(_ for _ in lines[:-1] if _)
+            logger.info("Loaded %d deleted IDs from journal %s", len(self.ids), path)
+            if lines[-1]:
+                # Truncate the partially-written ID so new IDs start on a new line
+                with path.open("r+", encoding="utf-8") as ofh:
+                    ofh.truncate(sum(len(_.encode("utf-8")) + 1 for _ in lines[:-1]))
+        self._fh = path.open("a", encoding="utf-8")
+
+    def __contains__(self, tweet_id: object) -> bool:
+        """Return True if the passed ID has been recorded as deleted."""
+        return tweet_id in self.ids
+
+    def __len__(self) -> int:
+        """Return the number of IDs recorded as deleted."""
+        return len(self.ids)
+
+    def __enter__(self) -> "DeletionJournal":
+        """Return the journal for use as a context manager."""
+        return self
+
+    def __exit__(self, *exc) -> None:
+        """Close the journal on leaving the context."""
+        self.close()
+
+    def record(self, tweet_id: str) -> None:
+        """Append the passed ID to the journal.
+
+        :param tweet_id:  ID of deleted tweet or DM
+        """
+        if tweet_id in self.ids:
+            return
+        self.ids.add(tweet_id)
+        self._fh.write(f"{tweet_id}\n")
+        self._unsynced += 1
+        if self._unsynced >= self.sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """Flush journal writes to disk."""
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        """Flush and close the journal file."""
+        if not self._fh.closed:
+            self.sync()
+            self._fh.close()
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 """Module providing support for package-level logging."""
 
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import queue
 import re
 import sys
 
@@ -19,7 +22,11 @@ class NoColorFormatter(logging.Formatter):
 
     def format(self, record):
         """Return logger message with terminal escapes removed."""
-        return "[%s] [%s]: %s" % (record.levelname, record.name, re.sub(self.ANSI_RE, "", record.msg % record.args),)
+        message = record.getMessage()
+        # Most messages contain no escapes, and need no substitution
+        if "\x1b" in message:
+            message = self.ANSI_RE.sub("", message)
+        return "[%s] [%s]: %s" % (record.levelname, record.name, message)
 
 
 def config_logger(args: Optional[Namespace] = None) -> None:
@@ -31,12 +38,16 @@ def config_logger(args: Optional[Namespace] = None) -> None:
     We configure a logger at package level, from which the module will
     inherit. If CLI args are provided, these are used to define output
     streams, and logging level.
+
+    Records are passed through a queue to a listener thread, which formats
+    them and writes them to the output streams, so that logging never
+    blocks the threads issuing API requests on terminal or file output.
     """
     # Default logger for this module
     logger = logging.getLogger(__package__)
-    logger.setLevel(logging.DEBUG)
+    handlers = []
 
-    # Create and add STDERR handler
+    # Create STDERR handler
     errformatter = logging.Formatter("[%(levelname)s] [%(name)s]: %(message)s")
     errhandler = logging.StreamHandler(sys.stderr)
     if args is not None and args.verbose:
@@ -46,9 +57,9 @@ def config_logger(args: Optional[Namespace] = None) -> None:
     else:
         errhandler.setLevel(logging.WARNING)
     errhandler.setFormatter(errformatter)
-    logger.addHandler(errhandler)
+    handlers.append(errhandler)
 
-    # If args.logfile is provided, add a FileHandler for logfile
+    # If args.logfile is provided, create a FileHandler for logfile
     if args is not None and args.logfile is not None:
         logdir = args.logfile.parents[0]
         # Check that output directory exists and, if not, create it
@@ -67,4 +78,16 @@ def config_logger(args: Optional[Namespace] = None) -> None:
         else:
             loghandler.setLevel(logging.INFO)
         loghandler.setFormatter(logformatter)
-        logger.addHandler(loghandler)
+        handlers.append(loghandler)
+
+    # Records below the level of every handler are discarded when they are logged,
+    # without being created or queued
+    logger.setLevel(min(_.level for _ in handlers))
+
+    # Queue records for the handlers, which run in the listener's thread; the
+    # listener is stopped, after writing any queued records, at exit
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    listener.start()
+    atexit.register(listener.stop)
@@ -1,18 +1,59 @@
 # -*- coding: utf-8 -*-
 """lptwitdelete script entry point."""
 
-import json
 import logging
 import sys
 import time
 
-from typing import List, Optional
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Optional
 
-from lptwitdelete.archive import load_filter_archive
-from lptwitdelete.config import Config
+from lptwitdelete.archive import iter_filter_archive
+from lptwitdelete.checkpoint import CheckpointFile
+from lptwitdelete.config import Config, config_accounts
+from lptwitdelete.journal import DeletionJournal
 from lptwitdelete.logger import config_logger
+from lptwitdelete.metrics import get_metrics
+from lptwitdelete.output import iter_records, write_records
 from lptwitdelete.parser import parse_cmdline
-from lptwitdelete.twitter import delete_tweets, filter_twitter, oauth_login
+from lptwitdelete.planner import format_plan, plan_deletion
+from lptwitdelete.records import RETWEET, TWEET, Record, compact, unique
+from lptwitdelete.twitter import delete_tweets, filter_twitter, oauth_login, pooled_session
+
+if TYPE_CHECKING:
+    from lptwitdelete.fakeapi import FakeTwitter
+
+# Command-line options that may be set for each account in the config file in
+# batch mode, and those of them that are paths
+ACCOUNT_OPTIONS = {
+    "archpath",
+    "infile",
+    "outfile",
+    "journal",
+    "resume",
+    "cache_dir",
+    "content",
+    "start_date",
+    "end_date",
+    "is_retweet",
+    "is_reply",
+    "since_id",
+    "checkpoint",
+    "conversation",
+    "sender",
+    "text",
+    "hashtag",
+    "mention",
+    "domain",
+    "regex",
+    "filter",
+    "columnar",
+    "reconcile",
+    "concurrency",
+}
+PATH_OPTIONS = {"archpath", "infile", "outfile", "journal", "cache_dir", "checkpoint"}
 
 
 def main(argv: Optional[List[str]] = None):
@@ -28,42 +69,262 @@ def main(argv: Optional[List[str]] = None):
     logger = logging.getLogger(__name__)
     config_logger(args)
 
-    # Authenticate with Twitter
-    if args.skip_auth:
-        logger.warning("Skipping OAuth with Twitter!")
-        api = None
-    else:
-        keys = Config(args.username, args.confpath)
-        api = oauth_login(keys.CONSUMER_KEY, keys.CONSUMER_SECRET, keys.ACCESS_KEY, keys.ACCESS_SECRET)
-        logger.info("Authenticated with Twitter as %s", api.verify_credentials().screen_name)
-
-    # If archive file is supplied, load tweets into memory; any filtering on command-line
-    # terms is performed in the load_filter_archive() call
-    # If an archive file is not supplied, we attempt to use the Twitter API
-    if args.archpath:
-        try:
-            tweets = load_filter_archive(args)
-        except FileNotFoundError:
-            logger.error(f"Archive file {args.archpath} cannot be found (exiting)")
-            sys.exit(1)
+    if args.batch == (args.username is not None):
+        logger.error("Give either a Twitter username, or --batch to process all accounts in the config file (exiting)")
+        raise SystemError(1)
+
+    metrics = get_metrics()
+    if args.batch:
+        run_batch(args)
     else:
-        tweets = filter_twitter(api, args)
-    logger.info("Filtered archive contains %s tweets for deletion", len(tweets))
+        # Authenticate with Twitter, unless a local fake API is used instead; connections
+        # are kept open for each deletion worker, and for timeline requests
+        fake, session = None, None
+        if args.fake_api is not None:
+            # Imported here as it imports requests, which is slow to import
+            from lptwitdelete.fakeapi import FakeTwitter
 
-    # Write filtered tweets (that will be deleted) to file as JSON, if requested
-    if args.outfile:
-        try:
-            with args.outfile.open("w") as ofh:
-                json.dump(tweets, ofh)
-            logger.info("Wrote %d tweets to %s", len(tweets), args.outfile)
-        except IOError:
-            logger.error(
-                "Could not write filtered tweets to %s (exiting)", args.outfile
+            logger.warning("Using a local fake Twitter API; nothing will be deleted from Twitter")
+            fake = FakeTwitter.from_settings(args.fake_api, args.username)
+            session = pooled_session(args.concurrency + 1)
+            api = fake.login(session)
+        elif args.skip_auth:
+            logger.warning("Skipping OAuth with Twitter!")
+            api = None
+        else:
+            keys = Config(args.username, args.confpath)
+            session = pooled_session(args.concurrency + 1)
+            api = oauth_login(
+                keys.CONSUMER_KEY, keys.CONSUMER_SECRET, keys.ACCESS_KEY, keys.ACCESS_SECRET, session=session
             )
-            raise SystemError(1)
+            logger.info("Authenticated with Twitter as %s", api.verify_credentials().screen_name)
+        run_account(args, api)
+        if session is not None:
+            session.release()
+        if fake is not None:
+            log_fake_api_stats(fake)
 
-    # Delete tweets in filtered set
-    if args.delete:
-        delete_tweets(api, tweets)
+    # Write run metrics, if requested
+    if args.report:
+        metrics.write_json(args.report)
+        logger.info("Wrote run metrics to %s", args.report)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+        logger.info("Wrote run metrics to %s", args.prometheus)
 
     logger.info("Time taken: %.2fs", time.time() - time0)
+
+
+def run_account(args: Namespace, api) -> None:
+    """Filter, and optionally delete, tweets for a single account.
+
+    :param args:  Namespace of command-line arguments for the account
+    :param api:  authenticated tweepy API stream (None if authentication was skipped)
+    """
+    logger = logging.getLogger(__name__)
+
+    if args.resume and args.journal is None:
+        logger.error("--resume requires a deletion journal to be given with --journal (exiting)")
+        raise SystemError(1)
+    if args.reconcile and api is None:
+        logger.error("--reconcile requires authentication with Twitter (exiting)")
+        raise SystemError(1)
+
+    # Skip tweets processed by earlier runs with the same filters, if requested; the
+    # mark is raised for every tweet loaded from the archive or timeline
+    checkpoints, mark = None, None
+    if args.checkpoint is not None and not args.infile:
+        checkpoints = CheckpointFile(args.checkpoint)
+        mark = checkpoints.get(args.username, args)
+        for kind, since in mark.marks.items():
+            logger.info("Skipping %s records with IDs up to %s (checkpoint %s)", kind, since["max_id"], args.checkpoint)
+
+    # If a file of previously-filtered tweets is supplied, load it without filtering.
+    # If an archive file is supplied, tweets are parsed and filtered lazily by the
+    # iterator from iter_filter_archive()
+    # Otherwise, we attempt to use the Twitter API
+    metrics = get_metrics()
+    tweets: Iterable[dict]
+    with metrics.stage("load"):
+        if args.infile:
+            if not args.infile.is_file():
+                logger.error(f"Filtered tweet file {args.infile} cannot be found (exiting)")
+                sys.exit(1)
+            logger.info("Loading previously filtered tweets from %s...", args.infile)
+            tweets = iter_records(args.infile)
+        elif args.archpath:
+            try:
+                tweets = iter_filter_archive(args, mark)
+            except FileNotFoundError:
+                logger.error(f"Archive file {args.archpath} cannot be found (exiting)")
+                sys.exit(1)
+        else:
+            tweets = filter_twitter(api, args, mark)
+    tweets = metrics.timed(tweets, "filter")
+
+    # Write filtered tweets (that will be deleted) to file as they pass the filters, if
+    # requested; only a compact record of each filtered tweet is held in memory, and
+    # only if it is to be deleted, and each is held once
+    if args.outfile:
+        tweets = write_records(tweets, args.outfile)
+    records: List[Record] = []
+    try:
+        if args.delete or args.plan:
+            records = list(unique(_ for _ in map(compact, tweets) if _ is not None))
+            count = len(records)
+        else:
+            count = sum(1 for _ in tweets)
+    except IOError:
+        if not args.outfile:
+            raise
+        logger.error("Could not write filtered tweets to %s (exiting)", args.outfile)
+        raise SystemError(1)
+    logger.info("Filtered archive contains %s tweets for deletion", count)
+
+    # Drop tweets from an archive or file that are no longer on Twitter, if requested;
+    # imported here so that numpy is only loaded when it is used
+    if args.reconcile and (args.delete or args.plan) and (args.infile or args.archpath):
+        from lptwitdelete.reconcile import reconcile
+
+        with metrics.stage("reconcile"):
+            records = reconcile(api, records)
+
+    # Report a schedule for deleting the filtered set, without deleting anything, if
+    # requested; tweets already recorded in the journal would be skipped
+    if args.plan:
+        if args.resume:
+            with DeletionJournal(args.journal) as journal:
+                records = [_ for _ in records if _.key not in journal]
+        print(format_plan(plan_deletion(records, concurrency=args.concurrency)))
+        return
+
+    # Delete tweets in filtered set, recording deleted IDs in the journal if requested
+    skipped: List[Record] = []
+    if args.delete:
+        with metrics.stage("delete"):
+            if args.journal is None:
+                skipped = delete_tweets(api, records, concurrency=args.concurrency)
+            else:
+                with DeletionJournal(args.journal) as journal:
+                    skipped = delete_tweets(
+                        api,
+                        records,
+                        concurrency=args.concurrency,
+                        journal=journal,
+                        resume=args.resume,
+                    )
+
+    # Save the new checkpoint once the filtered tweets have been deleted; dry runs
+    # leave the checkpoint unchanged, so that a later run can delete the same tweets.
+    # The mark is kept below any tweet that could not be deleted, so that a later run
+    # tries it again; retweets are marked by the IDs of the retweets themselves, which
+    # are greater than those of the retweeted tweets, and likes are never marked
+    if checkpoints is not None:
+        if args.delete:
+            for record in skipped:
+                mark.lower(TWEET if record.kind == RETWEET else record.kind, int(record.id))
+            if skipped:
+                logger.info("Keeping checkpoint below %d records that could not be deleted", len(skipped))
+            checkpoints.set(args.username, args, mark)
+            logger.info("Saved checkpoint to %s", args.checkpoint)
+        else:
+            logger.info("Not updating checkpoint %s without --delete", args.checkpoint)
+
+
+def log_fake_api_stats(fake: "FakeTwitter") -> None:
+    """Log counts of requests made to a fake Twitter API, by endpoint and outcome.
+
+    :param fake:  fake Twitter API used for the run
+    """
+    logger = logging.getLogger(__name__)
+
+    for key, count in sorted(fake.stats.items()):
+        logger.info("Fake API %s for %s: %s requests", key, fake.screen_name, count)
+
+
+def account_args(args: Namespace, keys: Config) -> Namespace:
+    """Return command-line arguments updated with an account's options from the config file.
+
+    :param args:  Namespace of command-line arguments
+    :param keys:  configuration for the account
+    """
+    logger = logging.getLogger(__name__)
+
+    unknown = set(keys.OPTIONS) - ACCOUNT_OPTIONS
+    if unknown:
+        logger.error("Unknown options for %s in config file: %s (exiting)", keys.USERNAME, ", ".join(sorted(unknown)))
+        raise SystemError(1)
+    options = {
+        name: Path(value).expanduser() if name in PATH_OPTIONS and value is not None else value
+        for name, value in keys.OPTIONS.items()
+    }
+    return Namespace(**{**vars(args), **options, "username": keys.USERNAME})
+
+
+def run_batch(args: Namespace) -> None:
+    """Filter, and optionally delete, tweets for all accounts in the config file concurrently.
+
+    :param args:  Namespace of command-line arguments
+
+    Each account's pipeline runs in its own thread, with its own deletion
+    rate limit, but all accounts share a single pool of HTTP connections.
+    """
+    logger = logging.getLogger(__name__)
+
+    if args.outfile or args.infile or args.journal:
+        logger.error("--outfile, --infile and --journal must be set for each account in batch mode (exiting)")
+        raise SystemError(1)
+    usernames = config_accounts(args.confpath)
+    if not usernames:
+        logger.error("No accounts found in config file %s (exiting)", args.confpath)
+        raise SystemError(1)
+    accounts = {username: Config(username, args.confpath) for username in usernames}
+    accounts_args = {username: account_args(args, keys) for username, keys in accounts.items()}
+    logger.info("Processing %d accounts: %s", len(accounts), ", ".join(usernames))
+    if args.fake_api is not None:
+        logger.warning("Using a local fake Twitter API; nothing will be deleted from Twitter")
+    elif args.skip_auth:
+        logger.warning("Skipping OAuth with Twitter!")
+
+    # Allow a connection for each deletion worker, and for timeline requests, of every account
+    session = pooled_session(sum(_.concurrency + 1 for _ in accounts_args.values()))
+
+    def process(username: str) -> None:
+        keys = accounts[username]
+        fake = None
+        if args.fake_api is not None:
+            # Imported here as it imports requests, which is slow to import; each
+            # account's fake is mounted on a session of its own
+            from lptwitdelete.fakeapi import FakeTwitter
+
+            fake = FakeTwitter.from_settings(args.fake_api, username)
+            fake_session = pooled_session(accounts_args[username].concurrency + 1)
+            api = fake.login(fake_session)
+        elif args.skip_auth:
+            api = None
+        else:
+            api = oauth_login(
+                keys.CONSUMER_KEY, keys.CONSUMER_SECRET, keys.ACCESS_KEY, keys.ACCESS_SECRET, session=session
+            )
+            logger.info("Authenticated with Twitter as %s", api.verify_credentials().screen_name)
+        run_account(accounts_args[username], api)
+        if fake is not None:
+            fake_session.release()
+            log_fake_api_stats(fake)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(accounts), thread_name_prefix="account") as pool:
+        futures = {username: pool.submit(process, username) for username in usernames}
+        for username, future in futures.items():
+            try:
+                future.result()
+            except (Exception, SystemExit):
+                logger.error("Processing failed for %s", username, exc_info=True)
+                failed.append(username)
+            else:
+                logger.info("Finished processing %s", username)
+    session.release()
+
+    if failed:
+        logger.error("Processing failed for %d accounts: %s (exiting)", len(failed), ", ".join(failed))
+        raise SystemError(1)
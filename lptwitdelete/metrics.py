@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Instrumentation of lptwitdelete runs: stage timings, API latencies and counters."""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+
+# Upper bounds of API latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefix for metric names in Prometheus output
+PROMETHEUS_PREFIX = "lptwitdelete"
+
+
+class Histogram:
+
+    """Distribution of observed values in fixed buckets, as used by Prometheus."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        """Create an empty histogram with the passed bucket upper bounds."""
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Add an observation to the histogram."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        """Return cumulative counts for each bucket, ending with the +Inf bucket."""
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+    def as_dict(self) -> Dict:
+        """Return histogram as a JSON-serialisable dictionary."""
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "buckets": dict(zip([str(_) for _ in self.buckets] + ["+Inf"], self.cumulative())),
+        }
+
+
+class Metrics:
+
+    """Thread-safe collection of stage timings, histograms and counters for a run.
+
+    Stage timings are exclusive: time spent in a stage entered while another
+    is active (e.g. parsing records pulled through a filter) is charged only
+    to the inner stage, so stage times add up to the instrumented wall time.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty set of metrics."""
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+
+    def _charge(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Context manager charging time spent in the context to the named stage."""
+        stack = self._local.__dict__.setdefault("stack", [])
+        now = time.perf_counter()
+        if stack:
+            self._charge(stack[-1][0], now - stack[-1][1])
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._charge(name, now - stack.pop()[1])
+            if stack:
+                stack[-1][1] = now
+
+    def timed(self, iterable: Iterable, name: str) -> Iterator:
+        """Yield items from the passed iterable, charging time spent producing them to the named stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Add the passed value to the named counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Add an observation to the named histogram."""
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def report(self) -> Dict:
+        """Return all metrics as a JSON-serialisable dictionary.
+
+        The process CPU time can be compared to the wall time to tell whether a
+        run was CPU-bound, or spent its time waiting on the API.
+        """
+        with self._lock:
+            return {
+                "wall_seconds": time.perf_counter() - self._wall0,
+                "cpu_seconds": time.process_time() - self._cpu0,
+                "stages": dict(self.stages),
+                "counters": dict(self.counters),
+                "histograms": {name: hist.as_dict() for name, hist in self.histograms.items()},
+            }
+
+    def write_json(self, path: Path) -> None:
+        """Write metrics report to the passed path as JSON."""
+        with path.open("w") as ofh:
+            json.dump(self.report(), ofh, indent=2)
+
+    def write_prometheus(self, path: Path) -> None:
+        """Write metrics to the passed path in Prometheus textfile format.
+
+        The file is written to a temporary file and renamed into place, as
+        the Prometheus textfile collector requires.
+        """
+        report = self.report()
+        lines = [
+            f"# TYPE {PROMETHEUS_PREFIX}_wall_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_wall_seconds {report['wall_seconds']}",
+            f"# TYPE {PROMETHEUS_PREFIX}_cpu_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_cpu_seconds {report['cpu_seconds']}",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge",
+        ]
+        lines += [
+            f'{PROMETHEUS_PREFIX}_stage_seconds{{stage="{name}"}} {value}' for name, value in report["stages"].items()
+        ]
+        for name, value in report["counters"].items():
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter", f"{PROMETHEUS_PREFIX}_{name}_total {value}"]
+        with self._lock:
+            histograms = list(self.histograms.items())
+        for name, hist in histograms:
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            bounds = [str(_) for _ in hist.buckets] + ["+Inf"]
+            lines += [f'{metric}_bucket{{le="{bound}"}} {count}' for bound, count in zip(bounds, hist.cumulative())]
+            lines += [f"{metric}_sum {hist.total}", f"{metric}_count {hist.count}"]
+
+        tmppath = path.with_name(path.name + ".tmp")
+        with tmppath.open("w") as ofh:
+            ofh.write("\n".join(lines) + "\n")
+        os.replace(tmppath, path)
+
+
+_registry: Dict[str, Metrics] = {}
+_registry_lock = threading.Lock()
+
+
+def get_metrics(name: str = "") -> Metrics:
+    """Return the named Metrics instance, creating it if necessary.
+
+    :param name:  name of metrics collection ("" for the default collection)
+
+    As with logging.getLogger(), all calls with the same name return the same
+    instance, so any module can record metrics for the current run.
+    """
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Metrics()
+        return _registry[name]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Streaming reading and writing of filtered tweet files."""
+
+import gzip
+import io
+import json
+import logging
+
+from pathlib import Path
+from typing import IO, Iterable, Iterator
+
+from lptwitdelete.archive import iter_json_array
+from lptwitdelete.metrics import get_metrics
+
+try:
+    import zstandard
+except ImportError:  # zstandard is an optional dependency
+    zstandard = None
+
+# Size of the buffer used when reading and writing files (bytes)
+BUFFER_SIZE = 1 << 20
+
+
+def open_text(path: Path, mode: str = "r") -> IO[str]:
+    """Open a file for buffered text reading or writing, compressed according to suffix.
+
+    :param path:  path to file; .gz files are gzip and .zst files zstd compressed
+    :param mode:  "r" to read, or "w" to write
+    """
+    logger = logging.getLogger(__name__)
+
+    suffix = path.suffix.lower()
+    if suffix == ".gz":
+        stream = gzip.open(path, mode + "b")
+    elif suffix == ".zst":
+        if zstandard is None:
+            logger.error("Reading or writing %s requires zstandard to be installed (exiting)", path)
+            raise SystemError(1)
+        fh = path.open(mode + "b")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor().stream_writer(fh)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(fh)
+    else:
+        stream = path.open(mode + "b", buffering=0)
+
+    if mode == "w":
+        buffered = io.BufferedWriter(stream, buffer_size=BUFFER_SIZE)
+    else:
+        buffered = io.BufferedReader(stream, buffer_size=BUFFER_SIZE)
+    return io.TextIOWrapper(buffered, encoding="utf-8", newline="")
+
+
+def is_jsonl(path: Path) -> bool:
+    """Return True if the passed path names a JSON Lines file (.jsonl, .jsonl.gz, ...)."""
+    suffixes = [_.lower() for _ in path.suffixes]
+    if suffixes and suffixes[-1] in (".gz", ".zst"):
+        suffixes = suffixes[:-1]
+    return bool(suffixes) and suffixes[-1] == ".jsonl"
+
+
+class RecordWriter:
+
+    """Write records to file one at a time, as a JSON array or as JSON Lines.
+
+    Files named .jsonl are written as JSON Lines, and any others as a JSON
+    array that is written incrementally. Files named .gz or .zst are
+    compressed.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Open the passed file for writing.
+
+        :param path:  path to output file
+        """
+        self.path = path
+        self.jsonl = is_jsonl(path)
+        self.count = 0
+        self._fh = open_text(path, "w")
+        if not self.jsonl:
+            self._fh.write("[")
+
+    def __enter__(self) -> "RecordWriter":
+        """Return the writer for use as a context manager."""
+        return self
+
+    def __exit__(self, *exc) -> None:
+        """Close the writer on leaving the context."""
+        self.close()
+
+    def write(self, record: dict) -> None:
+        """Write a single record to the file.
+
+        :param record:  JSON dict for tweet or DM
+        """
+        if self.jsonl:
+            self._fh.write(json.dumps(record))
+            self._fh.write("\n")
+        else:
+            if self.count:
+                self._fh.write(",\n")
+            self._fh.write(json.dumps(record))
+        self.count += 1
+
+    def close(self) -> None:
+        """Complete and close the file."""
+        if not self._fh.closed:
+            if not self.jsonl:
+                self._fh.write("]")
+            self._fh.close()
+
+
+def write_records(records: Iterable[dict], path: Path) -> Iterator[dict]:
+    """Write records to the passed file as they are consumed, yielding each in turn.
+
+    :param records:  iterable of JSON format tweets or DMs
+    :param path:  path to output file
+
+    The file is completed when the records are exhausted.
+    """
+    logger = logging.getLogger(__name__)
+    metrics = get_metrics()
+
+    with RecordWriter(path) as writer:
+        for record in records:
+            with metrics.stage("write"):
+                writer.write(record)
+            yield record
+    logger.info("Wrote %d tweets to %s", writer.count, path)
+
+
+def iter_records(path: Path) -> Iterator[dict]:
+    """Yield records one at a time from a file written by RecordWriter.
+
+    :param path:  path to JSON array or JSON Lines file, optionally compressed
+
+    JSON arrays are parsed incrementally, so this can also read Twitter
+    archive files. An empty file holds no records.
+    """
+    with open_text(path, "r") as ifh:
+        start = ifh.buffer.peek(BUFFER_SIZE).lstrip()[:1]
+        if is_jsonl(path) or start == b"{":
+            # JSON Lines: one record per line
+            for line in ifh:
+                if line.strip():
+                    yield json.loads(line)
+        elif start:
+            yield from iter_json_array(ifh)
@@ -14,11 +14,40 @@ def build_parser() -> ArgumentParser:
     parser = ArgumentParser()
 
     # Required positional arguments
-    parser.add_argument(action="store", type=str, dest="username", default=None, help="Twitter username")
+    parser.add_argument(
+        action="store", type=str, dest="username", nargs="?", default=None, help="Twitter username (omit with --batch)"
+    )
 
     # Optional arguments
     parser.add_argument(
-        "-a", "--archpath", type=Path, dest="archpath", default=None, help="Path to Twitter archive file"
+        "-a",
+        "--archpath",
+        type=Path,
+        dest="archpath",
+        default=None,
+        help="Path to Twitter archive file, zip file, or extracted archive directory",
+    )
+    parser.add_argument(
+        "--content",
+        dest="content",
+        choices=["tweets", "dms", "likes", "retweets", "all"],
+        default="tweets",
+        help="content to load from an archive, and delete or undo; all loads tweets, DMs and likes "
+        "(default: tweets, or the content of a single archive file)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        dest="workers",
+        default=None,
+        help="number of processes for parsing archive parts, or with --parallel (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--parallel",
+        dest="parallel",
+        default=False,
+        action="store_true",
+        help="parse and filter a single archive file in chunks, in parallel processes",
     )
     parser.add_argument(
         "--start_date", type=str, dest="start_date", default=None, help="Start date for deletion (YYYY-MM-DD)"
@@ -34,11 +63,113 @@ def build_parser() -> ArgumentParser:
         help="Only delete tweets that are retweets",
     )
     parser.add_argument(
-        "-o", "--outfile", dest="outfile", type=Path, default=None, help="Write filtered tweets to this file",
+        "-o",
+        "--outfile",
+        dest="outfile",
+        type=Path,
+        default=None,
+        help="Write filtered tweets to this file (.jsonl for JSON Lines; .gz/.zst to compress)",
+    )
+    parser.add_argument(
+        "-i",
+        "--infile",
+        dest="infile",
+        type=Path,
+        default=None,
+        help="Read previously filtered tweets from this file (written with --outfile), without filtering",
     )
     parser.add_argument(
         "--is_reply", dest="is_reply", default=False, action="store_true", help="Only delete tweets that are replies",
     )
+    parser.add_argument(
+        "--since_id",
+        type=int,
+        dest="since_id",
+        default=None,
+        metavar="ID",
+        help="only process tweets and DMs with IDs greater than this",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        dest="checkpoint",
+        default=None,
+        help="skip tweets and DMs processed by earlier runs with the same filters, recorded in this file",
+    )
+    parser.add_argument(
+        "--conversation",
+        dest="conversation",
+        action="append",
+        default=None,
+        metavar="ID",
+        help="only delete DMs in the conversation with this ID (may be repeated)",
+    )
+    parser.add_argument(
+        "--sender",
+        dest="sender",
+        action="append",
+        default=None,
+        metavar="ID",
+        help="only delete DMs sent by the user with this ID (may be repeated)",
+    )
+    parser.add_argument(
+        "--text",
+        dest="text",
+        action="append",
+        default=None,
+        metavar="WORDS",
+        help="only delete tweets containing all these words (may be repeated, to delete tweets matching any)",
+    )
+    parser.add_argument(
+        "--hashtag",
+        dest="hashtag",
+        action="append",
+        default=None,
+        help="only delete tweets with this hashtag (may be repeated)",
+    )
+    parser.add_argument(
+        "--mention",
+        dest="mention",
+        action="append",
+        default=None,
+        metavar="USER",
+        help="only delete tweets mentioning this screen name (may be repeated)",
+    )
+    parser.add_argument(
+        "--domain",
+        dest="domain",
+        action="append",
+        default=None,
+        help="only delete tweets linking to this domain, or its subdomains (may be repeated)",
+    )
+    parser.add_argument(
+        "--regex",
+        dest="regex",
+        default=None,
+        metavar="PATTERN",
+        help="only delete tweets whose text matches this regular expression",
+    )
+    parser.add_argument(
+        "-f",
+        "--filter",
+        dest="filter",
+        default=None,
+        help="only delete tweets matching this filter expression (e.g. 'retweet and created < 2020-01-01')",
+    )
+    parser.add_argument(
+        "--columnar",
+        dest="columnar",
+        default=False,
+        action="store_true",
+        help="filter tweets as vectorized masks over columns (requires numpy)",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=Path,
+        dest="cache_dir",
+        default=None,
+        help="cache a binary index of the archive in this directory (requires numpy)",
+    )
 
     parser.add_argument(
         "-c",
@@ -48,6 +179,13 @@ def build_parser() -> ArgumentParser:
         default=Path.home() / ".twitter/lptwitdelete/conf.yml",
         help="Path to config file with API keys",
     )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        dest="batch",
+        default=False,
+        help="process all accounts in the config file concurrently, instead of a single username",
+    )
     parser.add_argument(
         "-v", "--verbose", action="store_true", dest="verbose", default=False, help="report verbose progress to log",
     )
@@ -57,6 +195,41 @@ def build_parser() -> ArgumentParser:
     parser.add_argument(
         "--delete", action="store_true", dest="delete", default=False, help="actually delete tweets from Twitter",
     )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        dest="plan",
+        default=False,
+        help="report a schedule and estimated time for deleting the filtered tweets, without deleting them",
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        dest="reconcile",
+        default=False,
+        help="before deleting tweets filtered from an archive, drop those no longer on Twitter (saves API requests)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        dest="concurrency",
+        default=1,
+        help="number of concurrent deletion requests (shared rate limit)",
+    )
+    parser.add_argument(
+        "--journal",
+        type=Path,
+        dest="journal",
+        default=None,
+        help="record IDs of deleted tweets in this journal file",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        default=False,
+        help="skip tweets already recorded as deleted in the journal",
+    )
     parser.add_argument(
         "--skip_auth",
         action="store_true",
@@ -64,6 +237,31 @@ def build_parser() -> ArgumentParser:
         default=False,
         help="skip Twitter OAuth (e.g. for searching archive)",
     )
+    parser.add_argument(
+        "--fake_api",
+        dest="fake_api",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="SETTINGS",
+        help="use a local fake Twitter API instead of Twitter, e.g. for load tests; optional comma-separated "
+        "settings: latency, error_rate, gone_rate, rate_limit, window, tweets, seed, archive (tweet archive file whose "
+        "tweets form the timeline); e.g. latency=0.1,rate_limit=300",
+    )
+    parser.add_argument(
+        "--report",
+        dest="report",
+        type=Path,
+        default=None,
+        help="write run metrics (stage timings, API latencies, counts) to this JSON file",
+    )
+    parser.add_argument(
+        "--prometheus",
+        dest="prometheus",
+        type=Path,
+        default=None,
+        help="write run metrics to this file in Prometheus textfile format",
+    )
     parser.add_argument(
         "-l", "--logfile", dest="logfile", action="store", default=None, type=Path, help="logfile location",
     )
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Plan deletions, estimating how long they will take under the API rate limits."""
+
+import math
+import time
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+from lptwitdelete.records import DM, LIKE, RETWEET, TWEET, Record
+
+# Deletion endpoint for each kind of record, as (resource family, endpoint)
+ENDPOINTS = {
+    TWEET: ("statuses", "/statuses/destroy/:id"),
+    DM: ("direct_messages", "/direct_messages/events/destroy"),
+    LIKE: ("favorites", "/favorites/destroy"),
+    RETWEET: ("statuses", "/statuses/unretweet/:id"),
+}
+
+# Quota (requests per rate-limit window) assumed for deletion endpoints, whose limits
+# the API does not report, and the length of a rate-limit window (seconds)
+ASSUMED_LIMIT = 300
+RATE_LIMIT_WINDOW = 15 * 60
+
+# Time taken by each deletion request (seconds)
+ASSUMED_LATENCY = 0.25
+
+# Number of rate-limit windows listed in a formatted schedule
+MAX_SCHEDULE_LINES = 8
+
+
+def endpoint_quota(kind: str, now: float) -> Dict[str, Any]:
+    """Return limit, remaining requests and reset time of the deletion endpoint for a kind of record.
+
+    :param kind:  kind of record (TWEET, DM, LIKE or RETWEET)
+    :param now:  current UNIX time
+
+    The API's rate_limit_status only reports the quotas of GET endpoints, so
+    the quota of each deletion endpoint is assumed, with a full window
+    remaining.
+    """
+    return {
+        "limit": ASSUMED_LIMIT,
+        "remaining": ASSUMED_LIMIT,
+        "reset": now + RATE_LIMIT_WINDOW,
+        "source": "assumed",
+    }
+
+
+def schedule(
+    count: int, limit: int, remaining: int, reset_in: float, concurrency: int, latency: float
+) -> Tuple[List[Tuple[float, int]], float]:
+    """Return schedule of (start, requests) batches, and the total time, to make a number of requests.
+
+    :param count:  number of requests
+    :param limit:  requests allowed in each rate-limit window
+    :param remaining:  requests remaining in the current window
+    :param reset_in:  time until the current window resets (seconds)
+    :param concurrency:  number of concurrent requests
+    :param latency:  time taken by each request (seconds)
+
+    Each batch starts when its window opens, or when the previous batch
+    finishes if that is later, and takes as long as its requests take at the
+    passed concurrency.
+    """
+    batches: List[Tuple[float, int]] = []
+    elapsed, allowance, reset_at = 0.0, remaining, max(reset_in, 0.0)
+    while count > 0:
+        batch = min(count, allowance)
+        if batch > 0:
+            batches.append((elapsed, batch))
+            elapsed += batch * latency / max(concurrency, 1)
+            count -= batch
+        if count > 0:
+            elapsed = max(elapsed, reset_at)
+            reset_at = elapsed + RATE_LIMIT_WINDOW
+            allowance = max(limit, 1)
+    return batches, elapsed
+
+
+def plan_deletion(
+    records: Iterable[Record], concurrency: int = 1, latency: float = ASSUMED_LATENCY
+) -> Dict[str, Any]:
+    """Return plan for deleting the passed records, with a schedule and estimated duration.
+
+    :param records:  compact records for deletion
+    :param concurrency:  number of concurrent deletion requests
+    :param latency:  time taken by each deletion request (seconds)
+
+    Records are grouped by deletion endpoint, each with an assumed quota.
+    Records are deleted through all endpoints at once, so the plan takes as
+    long as its slowest endpoint. The estimate is only as good as the
+    assumed quotas and latency.
+    """
+    counts: Dict[str, int] = {}
+    for record in records:
+        counts[record.kind] = counts.get(record.kind, 0) + 1
+
+    now = time.time()
+
+    endpoints, total = [], 0.0
+    for kind, count in sorted(counts.items()):
+        quota = endpoint_quota(kind, now)
+        batches, seconds = schedule(
+            count, quota["limit"], quota["remaining"], quota["reset"] - now, concurrency, latency
+        )
+        endpoints.append(
+            {
+                "endpoint": ENDPOINTS[kind][1],
+                "kind": kind,
+                "count": count,
+                **quota,
+                "schedule": batches,
+                "seconds": seconds,
+            }
+        )
+        total = max(total, seconds)
+
+    return {
+        "created": now,
+        "concurrency": concurrency,
+        "latency": latency,
+        "endpoints": endpoints,
+        "seconds": total,
+    }
+
+
+def format_duration(seconds: float) -> str:
+    """Return duration as hours, minutes and seconds, e.g. 2h05m00s."""
+    seconds = int(math.ceil(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    return f"{minutes}m{seconds:02d}s"
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Return human-readable description of a deletion plan.
+
+    :param plan:  plan returned by plan_deletion()
+    """
+    lines = [f"Deletion plan (concurrency {plan['concurrency']}, assuming {plan['latency']:.3f}s per request):"]
+    for endpoint in plan["endpoints"]:
+        lines.append(
+            f"  {endpoint['endpoint']}: {endpoint['count']} {endpoint['kind']} records; "
+            f"{endpoint['limit']} requests per {format_duration(RATE_LIMIT_WINDOW)}, "
+            f"{endpoint['remaining']} remaining ({endpoint['source']} quota)"
+        )
+        for start, batch in endpoint["schedule"][:MAX_SCHEDULE_LINES]:
+            lines.append(f"    +{format_duration(start)}: {batch} deletions")
+        if len(endpoint["schedule"]) > MAX_SCHEDULE_LINES:
+            lines.append(f"    ... {len(endpoint['schedule']) - MAX_SCHEDULE_LINES} more rate-limit windows")
+        lines.append(f"    takes {format_duration(endpoint['seconds'])}")
+    finish = datetime.fromtimestamp(plan["created"] + plan["seconds"])
+    lines.append(
+        f"Estimated time, from assumed quotas: {format_duration(plan['seconds'])} "
+        f"(finishing around {finish:%Y-%m-%d %H:%M})"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Lightweight progress reporting, redrawn at a fixed interval rather than for every item."""
+
+import sys
+import time
+
+from typing import IO, Iterable, Iterator, Optional
+
+# Interval between redraws of progress on a terminal, and between progress lines
+# written to other streams, e.g. when stderr is redirected to a file (seconds)
+TERMINAL_INTERVAL = 0.2
+LOG_INTERVAL = 10.0
+
+
+class Progress:
+
+    """Count of items processed, with their rate, reported periodically to a stream.
+
+    Counting an item is only an addition and a clock read; progress is
+    drawn at most once per interval, so the cost of reporting stays the
+    same however quickly items are processed.
+    """
+
+    def __init__(
+        self,
+        total: Optional[int] = None,
+        unit: str = "it",
+        stream: Optional[IO[str]] = None,
+        interval: Optional[float] = None,
+    ) -> None:
+        """Create progress reporter.
+
+        :param total:  number of items expected (or None if unknown)
+        :param unit:  name of the items counted
+        :param stream:  stream to which progress is written (default: stderr)
+        :param interval:  minimum time between reports (seconds); by default,
+                          TERMINAL_INTERVAL for a terminal, else LOG_INTERVAL
+        """
+        self.total = total
+        self.unit = unit
+        self.stream = stream if stream is not None else sys.stderr
+        self.terminal = self.stream.isatty()
+        self.interval = interval if interval is not None else TERMINAL_INTERVAL if self.terminal else LOG_INTERVAL
+        self.count = 0
+        self._start = time.monotonic()
+        self._next = self._start + self.interval
+        self._closed = False
+
+    def update(self, count: int = 1) -> None:
+        """Count processed items, and report progress if the interval has passed."""
+        self.count += count
+        if time.monotonic() >= self._next:
+            self._report()
+
+    def iterate(self, items: Iterable) -> Iterator:
+        """Yield the passed items, counting each, and close the reporter when they are exhausted."""
+        for item in items:
+            yield item
+            self.update()
+        self.close()
+
+    def close(self) -> None:
+        """Report final progress."""
+        if not self._closed:
+            self._closed = True
+            self._report()
+            if self.terminal:
+                self.stream.write("\n")
+            self.stream.flush()
+
+    def format(self) -> str:
+        """Return description of progress, e.g. 120/300 tweets [0m12s, 10.0 tweets/s]."""
+        elapsed = time.monotonic() - self._start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        done = f"{self.count}" if self.total is None else f"{self.count}/{self.total}"
+        minutes, seconds = divmod(int(elapsed), 60)
+        return f"{done} {self.unit} [{minutes}m{seconds:02d}s, {rate:.1f} {self.unit}/s]"
+
+    def _report(self) -> None:
+        """Write progress to the stream, and schedule the next report."""
+        if self.terminal:
+            self.stream.write("\r" + self.format())
+        else:
+            self.stream.write(self.format() + "\n")
+        self._next = time.monotonic() + self.interval
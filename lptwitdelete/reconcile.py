@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Reconcile tweets filtered from an archive with those still on Twitter."""
+
+import logging
+
+from array import array
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Iterable, List, Sequence, Set
+
+from lptwitdelete.metrics import get_metrics
+from lptwitdelete.records import TWEET, Record
+from lptwitdelete.twitter import iter_timeline_pages
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency
+    np = None
+
+if TYPE_CHECKING:
+    import tweepy
+
+# Maximum number of IDs in a single lookup_statuses request
+LOOKUP_BATCH_SIZE = 100
+
+
+def timeline_ids(api: "tweepy.API") -> Sequence[int]:
+    """Return the IDs of all statuses served from the user's timeline, as a sorted int64 array.
+
+    :param api:  authenticated tweepy API stream
+    """
+    ids = array("q", (status.id for page in iter_timeline_pages(api) for status in page))
+    if np is not None:
+        return np.sort(np.frombuffer(ids, dtype=np.int64))
+    return array("q", sorted(ids))
+
+
+def is_member(ids: Sequence[int], known: Sequence[int]) -> List[bool]:
+    """Return whether each of the passed IDs is in a sorted array of known IDs.
+
+    :param ids:  IDs to look for
+    :param known:  sorted int64 array of known IDs
+
+    With numpy, all IDs are located by a single vectorised binary search;
+    otherwise each is located with bisect.
+    """
+    if np is not None:
+        ids = np.asarray(ids, dtype=np.int64)
+        known = np.asarray(known, dtype=np.int64)
+        if not len(known):
+            return [False] * len(ids)
+        positions = np.minimum(np.searchsorted(known, ids), len(known) - 1)
+        return (known[positions] == ids).tolist()
+    members = []
+    for tweet_id in ids:
+        idx = bisect_left(known, tweet_id)
+        members.append(idx < len(known) and known[idx] == tweet_id)
+    return members
+
+
+def lookup_existing(api: "tweepy.API", ids: Iterable[int]) -> Set[int]:
+    """Return those of the passed status IDs that still exist, looked up in batches.
+
+    :param api:  authenticated tweepy API stream
+    :param ids:  status IDs to look up
+
+    IDs in batches that cannot be looked up are assumed to exist, so that
+    their tweets are still submitted for deletion.
+    """
+    import tweepy
+
+    logger = logging.getLogger(__name__)
+
+    ids = list(ids)
+    existing: Set[int] = set()
+    for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        batch = ids[start : start + LOOKUP_BATCH_SIZE]
+        try:
+            statuses = api.lookup_statuses(batch, include_entities=False, trim_user=True)
+        except tweepy.errors.TweepyException:
+            logger.warning("Could not look up %d statuses; assuming they exist", len(batch), exc_info=True)
+            existing.update(batch)
+            continue
+        existing.update(status.id for status in statuses)
+    return existing
+
+
+def reconcile(api: "tweepy.API", records: List[Record]) -> List[Record]:
+    """Return those of the passed records that still exist on Twitter, in order.
+
+    :param api:  authenticated tweepy API stream
+    :param records:  compact records filtered from an archive
+
+    The timeline serves only the most recent statuses, so tweets at least as
+    new as the oldest of them exist only if they are on the timeline. Older
+    tweets are always looked up, LOOKUP_BATCH_SIZE IDs per request: the API
+    can return short pages, e.g. when statuses have been deleted, so a
+    timeline of fewer than TIMELINE_LIMIT statuses need not hold the whole
+    account. DMs cannot be looked up, and are all kept.
+    """
+    logger = logging.getLogger(__name__)
+
+    tweet_rows = [row for row, record in enumerate(records) if record.kind == TWEET]
+    if not tweet_rows:
+        return records
+    ids = [int(records[_].id) for _ in tweet_rows]
+
+    logger.info("Reconciling %d tweets with the Twitter timeline...", len(ids))
+    known = timeline_ids(api)
+    logger.info("Timeline contains %d statuses", len(known))
+    exists = is_member(ids, known)
+
+    oldest = int(known[0]) if len(known) else None
+    older = [tweet_id for tweet_id in ids if oldest is None or tweet_id < oldest]
+    if older:
+        logger.info("Looking up %d tweets older than the timeline...", len(older))
+        found = lookup_existing(api, older)
+        exists = [member or tweet_id in found for tweet_id, member in zip(ids, exists)]
+
+    gone = {row for row, member in zip(tweet_rows, exists) if not member}
+    get_metrics().count("reconciled_gone", len(gone))
+    logger.info("%d tweets had already been deleted, and will not be submitted for deletion", len(gone))
+    return [record for row, record in enumerate(records) if row not in gone]
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Compact representation of tweets, DMs, likes and retweets selected for deletion."""
+
+from itertools import zip_longest
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from lptwitdelete.filters import is_reply, is_retweet, record_timestamp
+
+# Kinds of record, each deleted (or, for likes and retweets, undone) through a
+# different API endpoint
+TWEET = "tweet"
+DM = "dm"
+LIKE = "like"
+RETWEET = "retweet"
+
+# Bit flags describing a record
+RETWEET_FLAG = 1
+REPLY_FLAG = 2
+
+
+class Record:
+
+    """The minimum needed to delete a tweet or DM, or undo a like or retweet: its ID, kind, timestamp and flags.
+
+    A Record is a small fraction of the size of the archive dict it is built
+    from, which carries entities, media and display ranges that deletion does
+    not need.
+    """
+
+    __slots__ = ("id", "kind", "timestamp", "flags")
+
+    def __init__(self, id: str, kind: str, timestamp: Optional[int] = None, flags: int = 0) -> None:
+        """Create a compact record.
+
+        :param id:  tweet or DM ID; for likes and retweets, the ID of the liked or retweeted tweet
+        :param kind:  kind of record (TWEET, DM, LIKE or RETWEET)
+        :param timestamp:  UNIX time at which the record was created
+        :param flags:  bitwise OR of RETWEET_FLAG and REPLY_FLAG
+        """
+        self.id = id
+        self.kind = kind
+        self.timestamp = timestamp
+        self.flags = flags
+
+    def __repr__(self) -> str:
+        """Return string representation of the record."""
+        return f"Record(id={self.id!r}, kind={self.kind!r}, timestamp={self.timestamp!r}, flags={self.flags!r})"
+
+    def __eq__(self, other: object) -> bool:
+        """Return True if the passed object is a record with the same values."""
+        if not isinstance(other, Record):
+            return NotImplemented
+        return (self.id, self.kind, self.timestamp, self.flags) == (
+            other.id,
+            other.kind,
+            other.timestamp,
+            other.flags,
+        )
+
+    @property
+    def key(self) -> str:
+        """Return key identifying the record in a deletion journal.
+
+        Tweets and DMs are identified by their IDs alone. Likes and retweets
+        share the IDs of the tweets they refer to, so their keys include
+        their kind.
+        """
+        return self.id if self.kind in (TWEET, DM) else f"{self.kind}:{self.id}"
+
+    @property
+    def is_retweet(self) -> bool:
+        """Return True if the record is a retweet."""
+        return bool(self.flags & RETWEET_FLAG)
+
+    @property
+    def is_reply(self) -> bool:
+        """Return True if the record is a reply."""
+        return bool(self.flags & REPLY_FLAG)
+
+    @classmethod
+    def from_dict(cls, record: dict) -> Optional["Record"]:
+        """Return compact record for a JSON format tweet, DM, like or retweet, or None if it has no ID.
+
+        :param record:  JSON dict for tweet, DM, like or retweet
+
+        Retweets are undone by the ID of the retweeted tweet where it is
+        known (i.e. for statuses from the timeline), and otherwise by the ID
+        of the retweet itself.
+        """
+        if "tweet" in record:
+            flags = (RETWEET_FLAG if is_retweet(record) else 0) | (REPLY_FLAG if is_reply(record) else 0)
+            return cls(record["tweet"]["id_str"], TWEET, record_timestamp(record), flags)
+        if "retweet" in record:
+            retweeted = record["retweet"].get("retweeted_status") or record["retweet"]
+            return cls(retweeted["id_str"], RETWEET, record_timestamp(record), RETWEET_FLAG)
+        if "like" in record:
+            return cls(record["like"]["tweetId"], LIKE)
+        for key in ("messageCreate", "welcomeMessageCreate"):
+            if key in record:
+                return cls(record[key]["id"], DM, record_timestamp(record))
+        return None
+
+
+def compact(record: Union[Record, dict]) -> Optional[Record]:
+    """Return compact version of the passed record, or None if it has no ID.
+
+    :param record:  JSON dict for tweet, DM, like or retweet, or Record
+    """
+    if isinstance(record, Record):
+        return record
+    return Record.from_dict(record)
+
+
+def unique(records: Iterable[Record]) -> Iterator[Record]:
+    """Yield the passed records, skipping any with the same kind and ID as an earlier record."""
+    seen = set()
+    for record in records:
+        if record.key not in seen:
+            seen.add(record.key)
+            yield record
+
+
+def interleave(records: Iterable[Record]) -> List[Record]:
+    """Return the passed records, alternating between kinds of record.
+
+    Records of each kind keep their order. Each kind is deleted through its
+    own endpoint, with its own rate limit, so alternating between kinds
+    keeps requests in flight to every endpoint at once.
+    """
+    kinds: Dict[str, List[Record]] = {}
+    for record in records:
+        kinds.setdefault(record.kind, []).append(record)
+    if len(kinds) <= 1:
+        return [_ for records in kinds.values() for _ in records]
+    return [_ for group in zip_longest(*kinds.values()) for _ in group if _ is not None]
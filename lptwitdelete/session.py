@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""HTTP sessions whose pooled connections are reused between API requests.
+
+This module imports requests, which is slow to import, and is imported only
+when a session is created.
+"""
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+
+class PooledSession(requests.Session):
+
+    """HTTP session keeping pooled connections open until it is released.
+
+    tweepy closes its session after every request, which would discard the
+    session's pooled connections, and those in use by other threads, so
+    close() leaves them open; release() closes them once all requests are
+    complete.
+    """
+
+    def __init__(self, pool_size: int) -> None:
+        """Create a session keeping up to the passed number of connections to each host open.
+
+        :param pool_size:  maximum number of pooled connections per host
+        """
+        super().__init__()
+        adapter = HTTPAdapter(pool_maxsize=max(pool_size, 1))
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def close(self) -> None:
+        """Keep pooled connections open; called by tweepy after every request."""
+
+    def release(self) -> None:
+        """Close the session's pooled connections, and those of any mounted adapters."""
+        super().close()
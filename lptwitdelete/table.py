@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Columnar, NumPy-backed representation of a tweet archive for vectorized filtering."""
+
+import logging
+
+from argparse import Namespace
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from lptwitdelete.expression import FIELDS, build_filter, compile_mask
+from lptwitdelete.filters import text_search
+from lptwitdelete.textindex import TextIndex
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency
+    np = None
+
+# Column names and NumPy dtypes of a TweetTable
+COLUMNS = {
+    "id": "int64",
+    "timestamp": "int64",
+    "is_retweet": "bool",
+    "is_reply": "bool",
+    "reply_to_user": "int64",
+    "favorite_count": "int64",
+    "retweet_count": "int64",
+}
+
+
+# Functions returning the value of each column for a single tweet
+EXTRACTORS = {column: extractor for column, extractor in FIELDS.values()}
+
+
+def tweet_row(tweet: dict) -> tuple:
+    """Return the column values for a single tweet, in COLUMNS order.
+
+    :param tweet:  JSON dict for tweet
+    """
+    return tuple(EXTRACTORS[column](tweet) for column in COLUMNS)
+
+
+class TweetTable:
+
+    """Tweets held as NumPy arrays, one per column, alongside the original records.
+
+    Filters are evaluated as boolean masks over whole columns, and the
+    matching records are returned in their original order. Term filters
+    are evaluated on an inverted index of the records, built when it is
+    first needed if it was not given.
+    """
+
+    def __init__(
+        self, columns: Dict[str, "np.ndarray"], records: List[dict], text_index: Optional[TextIndex] = None
+    ) -> None:
+        """Create a table from column arrays and the corresponding records.
+
+        :param columns:  dictionary of column name to NumPy array
+        :param records:  records corresponding to each row of the table
+        :param text_index:  inverted index of the records' terms (or None)
+        """
+        self.columns = columns
+        self.records = records
+        self.text_index = text_index
+
+    def __len__(self) -> int:
+        """Return the number of rows in the table."""
+        return len(self.records)
+
+    def __getitem__(self, column: str) -> "np.ndarray":
+        """Return the named column."""
+        return self.columns[column]
+
+    @classmethod
+    def from_records(cls, tweets: Iterable[dict]) -> "TweetTable":
+        """Build a table from an iterable of JSON format tweets.
+
+        :param tweets:  iterable of JSON format tweets
+        """
+        if np is None:
+            raise ImportError("numpy is required for columnar filtering")
+        records = list(tweets)
+        rows = [tweet_row(_) for _ in records]
+        columns = {}
+        for idx, (name, dtype) in enumerate(COLUMNS.items()):
+            columns[name] = np.fromiter((_[idx] for _ in rows), dtype=dtype, count=len(rows))
+        return cls(columns, records)
+
+    def constant(self, value: bool) -> "np.ndarray":
+        """Return a mask with the passed value for every row."""
+        return np.full(len(self), value, dtype=bool)
+
+    def match(self, kind: str, values: Tuple[FrozenSet[str], ...]) -> "np.ndarray":
+        """Return mask of rows containing all the terms of any of the passed values.
+
+        :param kind:  kind of term, from filters.TERM_KINDS
+        :param values:  sets of normalised terms
+        """
+        if self.text_index is None:
+            self.text_index = TextIndex.from_records(self.records)
+        mask = self.constant(False)
+        mask[self.text_index.rows(kind, values)] = True
+        return mask
+
+    def search(self, pattern: str) -> "np.ndarray":
+        """Return mask of rows whose text matches the passed regular expression.
+
+        :param pattern:  regular expression
+
+        Every record is searched, so this is not accelerated by the index.
+        """
+        return np.fromiter((text_search(_, pattern) for _ in self.records), dtype=bool, count=len(self))
+
+    def mask(self, args: Namespace) -> "np.ndarray":
+        """Return boolean mask of rows passing the command-line filters.
+
+        :param args:  command-line argument namespace
+        """
+        node = build_filter(args)
+        if node is None:
+            return self.constant(True)
+        return compile_mask(node)(self)
+
+    def select(self, mask: "np.ndarray") -> List[dict]:
+        """Return the records for rows where the passed mask is True, in order.
+
+        :param mask:  boolean mask over rows of the table
+        """
+        return [self.records[_] for _ in np.flatnonzero(mask)]
+
+
+def filter_tweets_columnar(tweets: Iterable, args: Namespace) -> List[dict]:
+    """Apply filters to tweets as vectorized masks and return filtered collection.
+
+    :param tweets:  iterable of JSON format tweets
+    :param args:  command-line argument namespace
+    """
+    logger = logging.getLogger(__name__)
+
+    if np is None:
+        logger.error("Columnar filtering requires numpy to be installed (exiting)")
+        raise SystemError(1)
+
+    table = TweetTable.from_records(tweets)
+    logger.info("Built columnar table of %d tweets", len(table))
+    return table.select(table.mask(args))
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Inverted index of the words, hashtags, mentions and linked domains of tweets."""
+
+import json
+
+from array import array
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from lptwitdelete.filters import TERM_KINDS, tweet_terms
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency
+    np = None
+
+
+class TextIndex:
+
+    """Rows of a tweet table containing each term, for each kind of term in TERM_KINDS.
+
+    Terms of each kind are held as a sorted vocabulary, with the rows of
+    all terms concatenated into one int64 array, and offsets into that
+    array for each term (i.e. compressed sparse rows). Tweets containing a
+    term are then found by a dictionary lookup and a slice, without looking
+    at the tweets themselves.
+
+    An index is either built by adding tweets, or saved in, and loaded
+    lazily from, the directory of an archive's cached index.
+    """
+
+    def __init__(self, indexdir: Optional[Path] = None) -> None:
+        """Create an empty index, or one backed by a saved index.
+
+        :param indexdir:  directory holding a saved index (or None)
+        """
+        self.indexdir = indexdir
+        self._terms: Dict[str, Dict[str, array]] = {kind: {} for kind in TERM_KINDS}
+        self._postings: Dict[str, Tuple[Dict[str, int], "np.ndarray", "np.ndarray"]] = {}
+
+    @classmethod
+    def from_records(cls, tweets: Iterable[dict]) -> "TextIndex":
+        """Return index of the passed tweets, whose rows are their positions in the iterable.
+
+        :param tweets:  iterable of JSON format tweets
+        """
+        index = cls()
+        for row, tweet in enumerate(tweets):
+            index.add(row, tweet)
+        return index
+
+    def add(self, row: int, tweet: dict) -> None:
+        """Add the terms of a tweet to the index.
+
+        :param row:  row of the tweet in its table; rows must be added in increasing order
+        :param tweet:  JSON dict for tweet
+        """
+        for kind in TERM_KINDS:
+            terms = self._terms[kind]
+            for term in tweet_terms(tweet, kind):
+                terms.setdefault(term, array("q")).append(row)
+
+    def postings(self, kind: str) -> Tuple[Dict[str, int], "np.ndarray", "np.ndarray"]:
+        """Return vocabulary (term: position), offsets and rows for a kind of term.
+
+        :param kind:  kind of term, from TERM_KINDS
+        """
+        if kind not in self._postings:
+            if self.indexdir is not None:
+                with (self.indexdir / f"text_{kind}_terms.json").open("r", encoding="utf-8") as ifh:
+                    vocabulary = json.load(ifh)
+                offsets = np.load(self.indexdir / f"text_{kind}_offsets.npy", mmap_mode="r")
+                rows = np.load(self.indexdir / f"text_{kind}_rows.npy", mmap_mode="r")
+            else:
+                terms = self._terms[kind]
+                vocabulary = sorted(terms)
+                offsets = np.zeros(len(vocabulary) + 1, dtype="int64")
+                np.cumsum([len(terms[_]) for _ in vocabulary], out=offsets[1:])
+                rows = np.empty(offsets[-1], dtype="int64")
+                for idx, term in enumerate(vocabulary):
+                    rows[offsets[idx] : offsets[idx + 1]] = np.frombuffer(terms[term], dtype="int64")
+            self._postings[kind] = ({term: idx for idx, term in enumerate(vocabulary)}, offsets, rows)
+        return self._postings[kind]
+
+    def term_rows(self, kind: str, term: str) -> "np.ndarray":
+        """Return sorted rows of the tweets containing a term.
+
+        :param kind:  kind of term, from TERM_KINDS
+        :param term:  normalised term
+        """
+        vocabulary, offsets, rows = self.postings(kind)
+        idx = vocabulary.get(term)
+        if idx is None:
+            return np.empty(0, dtype="int64")
+        return rows[offsets[idx] : offsets[idx + 1]]
+
+    def rows(self, kind: str, values: Iterable[FrozenSet[str]]) -> "np.ndarray":
+        """Return sorted rows of the tweets containing all the terms of any of the passed values.
+
+        :param kind:  kind of term, from TERM_KINDS
+        :param values:  sets of normalised terms, e.g. from filters.parse_terms()
+        """
+        matches = []
+        for value in values:
+            rows = None
+            for term in value:
+                found = self.term_rows(kind, term)
+                rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+            if rows is not None:
+                matches.append(rows)
+        if not matches:
+            return np.empty(0, dtype="int64")
+        return np.unique(np.concatenate(matches))
+
+    def save(self, indexdir: Path) -> None:
+        """Write the index to files in the passed directory.
+
+        :param indexdir:  directory in which to write the index
+        """
+        for kind in TERM_KINDS:
+            vocabulary, offsets, rows = self.postings(kind)
+            with (indexdir / f"text_{kind}_terms.json").open("w", encoding="utf-8") as ofh:
+                json.dump(sorted(vocabulary, key=vocabulary.get), ofh, ensure_ascii=False)
+            np.save(indexdir / f"text_{kind}_offsets.npy", offsets)
+            np.save(indexdir / f"text_{kind}_rows.npy", rows)
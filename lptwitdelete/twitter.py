@@ -2,75 +2,284 @@
 """Provides access to Twitter API."""
 
 import logging
+import queue
+import threading
 
 from argparse import Namespace
-from typing import List
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Union
 
-import tweepy
+from lptwitdelete.checkpoint import HighWaterMark, since_args
+from lptwitdelete.engine import DELETED, GONE, DeletionEngine
+from lptwitdelete.filters import filter_tweets, parse_created_at, parse_date
+from lptwitdelete.journal import DeletionJournal
+from lptwitdelete.progress import Progress
+from lptwitdelete.records import DM, LIKE, RETWEET, TWEET, Record, compact, interleave, unique
 
-from tqdm import tqdm
+# tweepy and requests are slow to import, and are imported only by the
+# functions that use them, so that archive-only runs start quickly
+if TYPE_CHECKING:
+    import requests
+    import tweepy
 
-from lptwitdelete.filters import filter_tweets
+    from lptwitdelete.session import PooledSession
 
+# Maximum number of statuses returned by a single user_timeline request
+TIMELINE_PAGE_SIZE = 200
 
-def delete_tweets(api: tweepy.API, tweets: List):
+# Number of most recent statuses the API serves from a user's timeline
+TIMELINE_LIMIT = 3200
+
+# Number of timeline pages fetched ahead of filtering
+PREFETCH_DEPTH = 2
+
+# Most recent HTTP response received by each thread, recorded by a session hook, so
+# that concurrent deletions each read the rate-limit headers of their own response
+_RESPONSES = threading.local()
+
+
+def record_response(response: "requests.Response", *args, **kwargs) -> None:
+    """Record the passed HTTP response as the most recent received by the current thread.
+
+    :param response:  HTTP response, passed by the session's response hooks
+    """
+    _RESPONSES.response = response
+
+
+def delete_record(api: "tweepy.API", record: Record):
+    """Delete the passed tweet or DM, or undo the passed like or retweet, using the appropriate Twitter API endpoint.
+
+    :param api:  authenticated tweepy API stream
+    :param record:  compact record for tweet, DM, like or retweet
+
+    Returns the HTTP response to the deletion request, if it was recorded.
+    """
+    _RESPONSES.response = None
+    if record.kind == TWEET:
+        api.destroy_status(record.id)
+    elif record.kind == DM:
+        api.delete_direct_message(record.id)
+    elif record.kind == LIKE:
+        api.destroy_favorite(record.id)
+    elif record.kind == RETWEET:
+        api.unretweet(record.id)
+    return _RESPONSES.response
+
+
+def delete_tweets(
+    api: "tweepy.API",
+    tweets: Iterable[Union[Record, dict]],
+    concurrency: int = 1,
+    journal: Optional[DeletionJournal] = None,
+    resume: bool = False,
+) -> List[Record]:
     """Delete passed tweets using Twitter API.
 
     :param api:  authenticated tweepy API stream
-    :param tweets:  iterable of tweets for deletion
+    :param tweets:  iterable of tweets, DMs, likes and retweets for deletion, as JSON dicts or compact records
+    :param concurrency:  number of concurrent deletion requests
+    :param journal:  journal in which to record the IDs of deleted tweets
+    :param resume:  if True, skip tweets already recorded in the journal
+
+    Each kind of record is deleted through its own endpoint, with its own
+    rate limit; kinds are interleaved, so that all endpoints are used at once.
+    Returns the records that could not be deleted.
     """
+    import tweepy
+
     logger = logging.getLogger(__name__)
+
+    # Only the ID and kind of each record is needed for deletion, and each is only
+    # deleted once
+    records = list(unique(_ for _ in map(compact, tweets) if _ is not None))
+
+    if resume and journal is not None:
+        count = len(records)
+        records = [_ for _ in records if _.key not in journal]
+        logger.info(
+            "Skipping %d tweets already deleted (journal %s)",
+            count - len(records),
+            journal.path,
+        )
+
     logger.info("Deleting (filtered) tweets from timeline...")
 
-    delete_tqdm = tqdm(tweets)
-    skipped = []
-    for tweet in delete_tqdm:
-        try:
-            if "tweet" in tweet:
-                delete_tqdm.set_description(tweet["tweet"]["id_str"])
-                api.destroy_status(tweet["tweet"]["id_str"])
-            elif "messageCreate" in tweet:
-                delete_tqdm.set_description(tweet["messageCreate"]["id"])
-                api.delete_direct_message(tweet["messageCreate"]["id"])
-            elif "welcomeMessageCreate" in tweet:
-                delete_tqdm.set_description(tweet["welcomeMessageCreate"]["id"])
-                api.delete_direct_message(tweet["welcomeMessageCreate"]["id"])
-        except tweepy.errors.TweepyException:
-            skipped.append(tweet)
+    progress = Progress(total=len(records), unit="tweets")
+
+    gone = []
+
+    def on_complete(tweet: Record, outcome: str):
+        progress.update()
+        if outcome == GONE:
+            gone.append(tweet.id)
+        # Tweets that no longer exist need never be attempted again
+        if outcome in (DELETED, GONE) and journal is not None:
+            journal.record(tweet.key)
 
+    engine = DeletionEngine(
+        lambda tweet: delete_record(api, tweet),
+        concurrency=concurrency,
+        bucket_key=lambda tweet: tweet.kind,
+        errors=(tweepy.errors.TweepyException,),
+        on_complete=on_complete,
+    )
+    skipped = engine.run(interleave(records))
+    progress.close()
+
+    if len(gone):
+        logger.info("%d tweets had already been deleted", len(gone))
     if len(skipped):
         logger.warning("Skipped %d tweets", len(skipped))
-        # logger.warning(
-        #     "Skipped tweets:\n\t%s",
-        #     "\n\t".join([_["tweet"]["id_str"] for _ in skipped]),
-        # )
+        logger.info(
+            "Skipped tweets:\n\t%s",
+            "\n\t".join([_.key for _ in skipped]),
+        )
+    return skipped
+
 
+def prefetch(iterable: Iterable, depth: int = PREFETCH_DEPTH) -> Iterator:
+    """Yield items from the passed iterable, which is consumed in a background thread.
 
-def filter_twitter(api: tweepy.API, args: Namespace):
+    :param iterable:  iterable to consume
+    :param depth:  maximum number of items fetched ahead of the consumer
+
+    Exceptions raised by the iterable are re-raised in the consumer. If the
+    consumer stops early, the background thread stops fetching.
+    """
+    items: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as exc:  # re-raised in the consumer
+            put((done, exc))
+
+    threading.Thread(target=worker, daemon=True).start()
+    try:
+        while True:
+            item, exc = items.get()
+            if item is done:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def iter_timeline_pages(api: "tweepy.API", since_id: Optional[int] = None) -> Iterator[List]:
+    """Yield pages of statuses from the authenticated user's timeline, newest first.
+
+    :param api:  authenticated tweepy API stream
+    :param since_id:  only fetch statuses with IDs greater than this (or None)
+
+    Pages are requested with the maximum page size, and without the full user
+    object in each status, to minimise the number and size of requests.
+    """
+    max_id = None
+    while True:
+        page = api.user_timeline(
+            count=TIMELINE_PAGE_SIZE, max_id=max_id, since_id=since_id, trim_user=True, tweet_mode="extended"
+        )
+        if not page:
+            return
+        yield page
+        max_id = page[-1].id - 1
+
+
+def filter_twitter(api: "tweepy.API", args: Namespace, mark: Optional[HighWaterMark] = None):
     """Filter tweets from a Twitter account based on passed options.
 
     :param api:  authenticated tweepy API stream
     :param args:  Namespace of command-line arguments
+    :param mark:  high-water mark from a previous run, raised for every status fetched
+
+    Pages of the timeline are fetched in a background thread while statuses
+    already received are filtered. The timeline is returned newest first, so
+    fetching stops at the first page reaching back before the start date.
+    Only statuses newer than the mark are requested. With --content
+    retweets, retweets are returned as retweet records, to be undone.
     """
     logger = logging.getLogger(__name__)
 
+    if args.content in ("dms", "likes"):
+        logger.error(
+            "Only tweets and retweets can be loaded from the timeline; give an archive for %s (exiting)", args.content
+        )
+        raise SystemError(1)
+
     # Iterate through tweets via API
     logger.info(
-        "Processing Twitter statuses for %s via web API...", api.me().screen_name
+        "Processing Twitter statuses for %s via web API...",
+        api.verify_credentials().screen_name,
     )
-    tweets = [_._json for _ in tqdm(tweepy.Cursor(api.user_timeline).items())]
+    args = since_args(args, mark, TWEET)
+    try:
+        start = parse_date(args.start_date) if args.start_date else None
+    except ValueError:
+        start = None  # reported when the filters are applied
+
+    def iter_statuses():
+        for page in prefetch(iter_timeline_pages(api, args.since_id)):
+            for status in page:
+                # Wrap statuses to match the format of archive records
+                yield {"tweet": status._json}
+            if start is not None and parse_created_at(page[-1]._json["created_at"]) < start:
+                logger.debug("Reached statuses posted before %s", args.start_date)
+                return
+
+    statuses = iter_statuses()
+    if mark is not None:
+        statuses = mark.track(statuses)
+    if args.content == "retweets":
+        args = Namespace(**{**vars(args), "is_retweet": True})
+        tweets = filter_tweets(Progress(unit="statuses").iterate(statuses), args)
+        return [{"retweet": _["tweet"]} for _ in tweets]
+    return filter_tweets(Progress(unit="statuses").iterate(statuses), args)
+
 
-    return filter_tweets(tweets, args)
+def pooled_session(pool_size: int) -> "PooledSession":
+    """Return HTTP session keeping up to the passed number of connections to each host open.
+
+    :param pool_size:  maximum number of pooled connections per host
+
+    OAuth credentials are attached to each request rather than to the session,
+    so a single session can be shared by the APIs of several accounts. The
+    connections stay open, and are reused, until the session is released.
+    """
+    from lptwitdelete.session import PooledSession
+
+    return PooledSession(pool_size)
 
 
 def oauth_login(
-    consumer_key: str, consumer_secret: str, access_token: str, access_token_secret: str
+    consumer_key: str,
+    consumer_secret: str,
+    access_token: str,
+    access_token_secret: str,
+    session: Optional["requests.Session"] = None,
 ):
     """Authenticate with Twitter via OAuth.
 
     :param consumer_key:  the consumer API key
     :param consumer_secret:  the consumer API secret key
+    :param session:  HTTP session for API requests, e.g. shared between accounts
     """
+    import tweepy
+
     logger = logging.getLogger(__name__)
     logger.info("Authenticating to Twitter via OAuth")
 
@@ -79,4 +288,11 @@ def oauth_login(
         consumer_key, consumer_secret, access_token, access_token_secret
     )
 
-    return tweepy.API(auth)
+    api = tweepy.API(auth)
+    if session is not None:
+        api.session = session
+
+    # Record each response, so that deletions can read their own rate-limit headers
+    if record_response not in api.session.hooks["response"]:
+        api.session.hooks["response"].append(record_response)
+    return api
@@ -54,7 +54,8 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     package_data={},
     include_package_date=True,
-    install_requires=["tweepy", "tqdm",],
+    install_requires=["requests", "tweepy",],
+    extras_require={"fast": ["numpy", "zstandard"]},
     classifiers=[
         "Development Status :: 4 - Beta",
         "Environment :: Console",